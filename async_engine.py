@@ -0,0 +1,312 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from datetime import datetime
+import threading
+import time as time_module
+
+from attendance_system import ZKTecoAttendance
+from sync_metrics import UPLOAD_SECONDS, UPLOAD_ERRORS, OUTBOX_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLogSender:
+    # Async front for a LogSender: the same payloads, chunking and per-record
+    # result parsing, posted over aiohttp when it is installed. Without aiohttp
+    # each batch goes through the blocking sender on a worker thread.
+    def __init__(self, sender):
+        self.sender = sender
+        self._session = None
+
+    async def open(self):
+        try:
+            import aiohttp
+        except ImportError:
+            logger.info("aiohttp not installed, uploading through the blocking sender on worker threads")
+            return
+        self._session = aiohttp.ClientSession(
+            headers={"x-api-key": self.sender.api_key, "Content-Type": "application/json"},
+            timeout=aiohttp.ClientTimeout(total=self.sender.timeout),
+            connector=aiohttp.TCPConnector(limit=self.sender.concurrency))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _status(self, status):
+        self.sender.last_status = f"{datetime.now()} → Status {status}"
+
+    async def send_one(self, payload):
+        started = time_module.perf_counter()
+        try:
+            async with self._session.post(self.sender.api_url, json=payload) as r:
+                status = r.status
+        except Exception as e:
+            UPLOAD_ERRORS.inc(status=type(e).__name__)
+            self.sender.last_status = f"Error: {e}"
+            logger.error(f"Error sending log: {e}")
+            return False
+        UPLOAD_SECONDS.observe(time_module.perf_counter() - started, mode="single")
+        self._status(status)
+        result = self.sender.record_result(status)
+        if not result:
+            UPLOAD_ERRORS.inc(status=status)
+        return result
+
+    async def send_batch(self, chunk):
+        # One bool per record, or None if the server rejected the batch format
+        body = "[" + ",".join(chunk) + "]"
+        started = time_module.perf_counter()
+        try:
+            async with self._session.post(self.sender.batch_url, data=body.encode("utf-8")) as r:
+                status = r.status
+                try:
+                    decoded = await r.json(content_type=None)
+                except ValueError:
+                    decoded = None
+        except Exception as e:
+            UPLOAD_ERRORS.inc(status=type(e).__name__)
+            self.sender.last_status = f"Error: {e}"
+            logger.error(f"Error sending batch of {len(chunk)} logs: {e}")
+            return [False] * len(chunk)
+
+        UPLOAD_SECONDS.observe(time_module.perf_counter() - started, mode="batch")
+        self._status(status)
+        ok = 200 <= status < 300
+        if not ok:
+            UPLOAD_ERRORS.inc(status=status)
+        if status == 413 and len(chunk) > 1:
+            # Too large for the server: halve and try again
+            mid = len(chunk) // 2
+            first, second = await asyncio.gather(self.send_batch(chunk[:mid]), self.send_batch(chunk[mid:]))
+            if first is None or second is None:
+                return None
+            return first + second
+
+        results = self.sender.batch_results(decoded, len(chunk))
+        if self.sender.batch_unsupported(status, results):
+            logger.warning(f"Batch upload not accepted → Status {status}, falling back to per-record upload")
+            return None
+        if results is None:
+            results = [ok] * len(chunk)
+        logger.info(f"Sent batch of {len(chunk)} logs → Status {status}, {results.count(True)} accepted")
+        return results
+
+    async def send(self, logs):
+        # One result per log (see LogSender.record_result), in input order
+        if not logs:
+            return []
+        if self._session is None:
+            return await asyncio.to_thread(self.sender.send, logs)
+        sender = self.sender
+        payloads = [sender.build_payload(log.user_id, log.timestamp) for log in logs]
+        results = [False] * len(payloads)
+        resend = []
+
+        if sender.batch_mode:
+            chunks = list(sender._chunk_payloads(payloads))
+            outcomes = await asyncio.gather(*(self.send_batch(chunk) for _, chunk in chunks))
+            for (start, chunk), chunk_results in zip(chunks, outcomes):
+                if chunk_results is None:
+                    # Server does not accept arrays: stay on per-record uploads from here on
+                    sender.batch_mode = False
+                    resend.extend(range(start, start + len(chunk)))
+                else:
+                    results[start:start + len(chunk)] = chunk_results
+        else:
+            resend = range(len(payloads))
+
+        outcomes = await asyncio.gather(*(self.send_one(payloads[i]) for i in resend))
+        for i, ok in zip(resend, outcomes):
+            results[i] = ok
+        return results
+
+
+class AsyncZKTecoAttendance(ZKTecoAttendance):
+    # ZKTecoAttendance whose background sync is an asyncio pipeline instead of
+    # one blocking loop:
+    #
+    #   read (device thread) → fetched queue → ingest (cache, outbox)
+    #   outbox → claim → upload queue → upload workers (async HTTP)
+    #
+    # The bounded queues hold back a stage that outruns the next one, and the
+    # outbox between ingest and upload means a slow API never delays device
+    # reads and a slow device never delays uploads. connect(), disconnect()
+    # and get_sync_status() behave as in ZKTecoAttendance.
+    def __init__(self, *args, fetch_queue_size=4, upload_queue_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetch_queue_size = fetch_queue_size
+        self.upload_queue_size = upload_queue_size or 2 * self.sender.concurrency
+        self._fetched = None
+        self._uploads = None
+        self._queued = None
+        self._loop = None
+        # Set by a worker whose whole batch failed, so claiming pauses until retries are due
+        self._stalled = False
+        self._checkpoint_lock = threading.Lock()
+
+    # ------------------ PIPELINE ------------------
+    def _sync_loop(self):
+        # Runs on the sync thread started by connect()
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            logger.error(f"Sync pipeline stopped: {e}")
+
+    async def _run(self):
+        logger.info("Starting asyncio sync pipeline...")
+        recovered = await asyncio.to_thread(self.outbox.recover)
+        if recovered:
+            logger.info(f"Recovered {recovered} in-flight logs from outbox")
+        self.last_sync_time = self._load_last_sync()
+
+        self._fetched = asyncio.Queue(self.fetch_queue_size)
+        self._uploads = asyncio.Queue(self.upload_queue_size)
+        # Set whenever records in the outbox may have become due: ingest queued
+        # some, an upload put some back for retry, or wake() was called
+        self._queued = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        # pyzk calls block; the connection serialises them, so one thread is enough
+        device_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="device-read")
+        uploader = AsyncLogSender(self.sender)
+        await uploader.open()
+
+        ingester = asyncio.create_task(self._ingest_stage())
+        claimer = asyncio.create_task(self._claim_stage())
+        workers = [asyncio.create_task(self._upload_stage(uploader))
+                   for _ in range(self.sender.concurrency)]
+        try:
+            await self._read_stage(device_executor)
+        finally:
+            self.sync_running = False
+            # Everything already read reaches the outbox before shutting down
+            await self._fetched.put(None)
+            await ingester
+            self._queued.set()
+            await claimer
+            for _ in workers:
+                await self._uploads.put(None)
+            await asyncio.gather(*workers)
+            await uploader.close()
+            device_executor.shutdown(wait=False)
+            self._loop = None
+
+    def wake(self):
+        super().wake()
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._queued.set)
+
+    async def _read_stage(self, executor):
+        loop = asyncio.get_running_loop()
+        while self.sync_running:
+            try:
+                # The connection supervisor reconnects in the background
+                if self.conn:
+                    logs = await loop.run_in_executor(executor, self._fetch_new)
+                    if len(logs):
+                        await self._fetched.put(logs)
+                else:
+                    logger.warning("Not connected, skipping device poll...")
+
+                if self.live_capture and self.conn:
+                    captured = await loop.run_in_executor(executor, self._capture, loop)
+                    if captured:
+                        self._wake.clear()
+                        continue
+            except Exception as e:
+                logger.error(f"Sync error: {e}")
+
+            await loop.run_in_executor(executor, self._sleep)
+
+    def _sleep(self):
+        self._wake.wait(self._next_delay())
+        self._wake.clear()
+
+    def _capture(self, loop):
+        # Realtime punches join the pipeline as they arrive; the capture thread
+        # waits while the fetched queue is full
+        def on_events(events):
+            asyncio.run_coroutine_threadsafe(
+                self._fetched.put(self.normalize(events)), loop).result()
+
+        with self.connection.session() as conn:
+            return self.fetcher.capture(
+                conn, on_events, self._next_delay(),
+                lambda: not self.sync_running or self._wake.is_set() or self.connection.waiters > 0)
+
+    async def _ingest_stage(self):
+        while True:
+            logs = await self._fetched.get()
+            if logs is None:
+                return
+            try:
+                if await asyncio.to_thread(self._ingest, logs):
+                    self._queued.set()
+            except Exception as e:
+                logger.error(f"Error queueing {len(logs)} logs: {e}")
+
+    async def _claim_stage(self):
+        # Feed due outbox records to the upload workers, one API batch at a
+        # time; waits on the upload queue while every worker is busy
+        while self.sync_running:
+            self._queued.clear()
+            claimed = []
+            if not self._stalled:
+                try:
+                    claimed = await asyncio.to_thread(self.outbox.claim, self.sender.batch_size)
+                except Exception as e:
+                    logger.error(f"Error claiming queued logs: {e}")
+            if claimed:
+                await self._uploads.put(claimed)
+                continue
+            self._stalled = False
+            depth = await asyncio.to_thread(self.outbox.depth)
+            OUTBOX_DEPTH.set(depth)
+            # Never sleep past the poll schedule, whatever else is pending
+            timeout = self.schedule.next_delay()
+            retry = await asyncio.to_thread(self.outbox.next_retry)
+            if retry is not None:
+                timeout = min(timeout, max(1.0, retry))
+            try:
+                await asyncio.wait_for(self._queued.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _upload_stage(self, uploader):
+        while True:
+            claimed = await self._uploads.get()
+            if claimed is None:
+                return
+            if not self.sync_running:
+                # Left in flight; recover() requeues them on the next start
+                continue
+            try:
+                records = await asyncio.to_thread(self.outbox.skip_acked, claimed)
+                if records:
+                    results = await uploader.send(records)
+                    if not any(results) and False in results:
+                        self._stalled = True
+                    await asyncio.to_thread(self._settle, records, results)
+                    if False in results:
+                        # Released records need a claim once their retry is due
+                        self._queued.set()
+            except Exception as e:
+                logger.error(f"Upload error: {e}")
+
+    def _settle(self, records, results):
+        self.outbox.settle(records, results)
+        self.last_api_status = self.sender.last_status
+        with self._checkpoint_lock:
+            self._update_checkpoint()
+
+    # ------------------ STATUS ------------------
+    def get_sync_status(self):
+        status = super().get_sync_status()
+        status["pipeline"] = {
+            "fetched": self._fetched.qsize() if self._fetched else 0,
+            "uploads": self._uploads.qsize() if self._uploads else 0,
+        }
+        return status
@@ -0,0 +1,87 @@
+import csv
+import gzip
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+# Format key → (label, file extension)
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz"),
+    "parquet": ("Parquet", ".parquet"),
+}
+
+EXPORT_COLUMNS = ["user_id", "user_name", "date", "check_in", "check_out", "duration"]
+
+
+class _CsvWriter:
+    def __init__(self, path, compress):
+        self.file = (gzip.open(path, "wt", encoding="utf-8", newline="") if compress
+                     else open(path, "w", encoding="utf-8", newline=""))
+        csv.writer(self.file, lineterminator="\n").writerow(EXPORT_COLUMNS)
+
+    def write(self, frame):
+        frame.to_csv(self.file, header=False, index=False)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.schema = pa.schema([
+            ("user_id", pa.string()),
+            ("user_name", pa.string()),
+            ("date", pa.date32()),
+            ("check_in", pa.timestamp("s")),
+            ("check_out", pa.timestamp("s")),
+            ("duration", pa.float64()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="snappy")
+
+    def write(self, frame):
+        # One row group per chunk
+        self.writer.write_table(self.pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+
+def export_chunks(chunks, path, fmt="csv", total=None, progress=None, should_stop=None):
+    # Write DataFrame chunks to path one at a time. The file is built under a
+    # .part name and only renamed into place once complete, so a cancelled or
+    # failed export never leaves a truncated file behind. Returns the row
+    # count, or None if should_stop() asked to cancel.
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {list(EXPORT_FORMATS)}")
+    partial = path + ".part"
+    writer = _ParquetWriter(partial) if fmt == "parquet" else _CsvWriter(partial, fmt == "csv.gz")
+    written = 0
+    try:
+        for frame in chunks:
+            if should_stop and should_stop():
+                writer.close()
+                os.remove(partial)
+                logger.info(f"Export to {path} cancelled after {written} rows")
+                return None
+            writer.write(frame[EXPORT_COLUMNS])
+            written += len(frame)
+            if progress:
+                progress(written, total)
+        writer.close()
+    except BaseException:
+        writer.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    logger.info(f"Exported {written} rows to {path}")
+    return written
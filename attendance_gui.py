@@ -1,15 +1,261 @@
 import sys
+import logging
+import threading
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QGroupBox, QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
-    QTextEdit, QDateEdit, QMessageBox, QMenuBar, QAction
+    QGroupBox, QLabel, QLineEdit, QPushButton, QTableView, QHeaderView,
+    QTextEdit, QDateEdit, QMessageBox, QMenuBar, QAction, QProgressBar,
+    QComboBox, QDialog
+)
+from PyQt5.QtCore import (
+    Qt, QDate, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal,
+    QAbstractTableModel, QModelIndex, QSortFilterProxyModel
 )
-from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QIntValidator, QIcon
 from attendance_system import ZKTecoAttendance
+from attendance_export import EXPORT_FORMATS
+import sync_metrics
+import numpy as np
 import pandas as pd
 
 
+# -------- Background Jobs --------
+class JobSignals(QObject):
+    progress = pyqtSignal(str)
+    percent = pyqtSignal(int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class DeviceJob(QRunnable):
+    # Runs fn(job) on the thread pool. fn reports stages with job.report() and
+    # checks job.is_cancelled() between them; a socket read already in progress
+    # cannot be interrupted, so cancelling discards its result instead.
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+        self.signals = JobSignals()
+        self._cancel = threading.Event()
+
+    def report(self, message, percent=None):
+        self.signals.progress.emit(message)
+        if percent is not None:
+            self.signals.percent.emit(int(percent))
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self):
+        try:
+            result = self.fn(self)
+        except Exception as e:
+            if self.is_cancelled():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(str(e))
+            return
+        if self.is_cancelled():
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(result)
+
+
+# -------- Attendance Table --------
+TABLE_COLUMNS = ["user_id", "user_name", "date", "check_in", "check_out", "duration"]
+TABLE_HEADERS = ["User ID", "Name", "Date", "Check In", "Check Out", "Duration (hours)"]
+
+
+class AttendanceTableModel(QAbstractTableModel):
+    # Reads straight from the DataFrame's column arrays; cells are formatted
+    # only when the view asks for them, and sorting reorders a row index
+    # instead of the data.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.df = None
+        self.columns = []
+        self.order = np.arange(0)
+        # Filter mask in original row order, and the same mask in display order
+        # as a plain list so the proxy's per-row lookup stays cheap
+        self.mask = None
+        self.accepted = None
+
+    def set_frame(self, df):
+        self.beginResetModel()
+        if df is None:
+            self.df, self.columns, self.order = None, [], np.arange(0)
+        else:
+            df = df.reset_index(drop=True)
+            for col in TABLE_COLUMNS:
+                if col not in df.columns:
+                    df[col] = pd.NA
+            self.df = df
+            self.columns = [df[col].array for col in TABLE_COLUMNS]
+            self.order = np.arange(len(df))
+        self.mask = None
+        self._update_accepted()
+        self.endResetModel()
+
+    def _update_accepted(self):
+        self.accepted = None if self.mask is None else self.mask[self.order].tolist()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(TABLE_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return TABLE_HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.columns[index.column()][self.order[index.row()]]
+        if TABLE_COLUMNS[index.column()] == "duration":
+            return f"{value:.2f}" if pd.notnull(value) else "N/A"
+        return str(value)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self.df is None:
+            return
+        self.layoutAboutToBeChanged.emit()
+        if column < 0:
+            self.order = np.arange(len(self.df))
+        else:
+            keys = self.df[TABLE_COLUMNS[column]]
+            if TABLE_COLUMNS[column] == "user_id":
+                numeric = pd.to_numeric(keys, errors="coerce")
+                if numeric.notna().all():
+                    keys = numeric
+            self.order = keys.sort_values(ascending=order == Qt.AscendingOrder, kind="stable",
+                                          na_position="last").index.to_numpy()
+        self._update_accepted()
+        self.layoutChanged.emit()
+
+    def set_filter_text(self, text):
+        # Keep rows whose ID or name contains text
+        text = text.strip().lower()
+        if self.df is None or not text:
+            self.mask = None
+        else:
+            user_ids = self.df["user_id"].astype(str).str.lower()
+            names = self.df["user_name"].astype(str).str.lower()
+            self.mask = (user_ids.str.contains(text, regex=False)
+                         | names.str.contains(text, regex=False)).to_numpy()
+        self._update_accepted()
+
+
+class AttendanceFilterProxy(QSortFilterProxyModel):
+    # Filters with the source model's precomputed mask; sorting is delegated
+    # to the source model so the proxy never builds its own per-row comparison.
+    def set_filter_text(self, text):
+        # A reset rebuilds the mapping in one pass; invalidateFilter() would
+        # emit a removal per dropped row range, which crawls on large tables
+        self.beginResetModel()
+        self.sourceModel().set_filter_text(text)
+        self.endResetModel()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        accepted = self.sourceModel().accepted
+        return accepted is None or accepted[source_row]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+
+# -------- Reports --------
+REPORTS = [
+    ("members", "Member summary"),
+    ("services", "Service days"),
+    ("weekly", "Weekly totals"),
+    ("monthly", "Monthly totals"),
+    ("yearly", "Year over year"),
+]
+
+
+class ReportTableModel(QAbstractTableModel):
+    # Read-only view of a small summary DataFrame; report columns vary by kind
+    def __init__(self, df, parent=None):
+        super().__init__(parent)
+        self.df = df.reset_index(drop=True)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.df)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.df.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return str(self.df.columns[section]).replace("_", " ").title().replace("Id", "ID")
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.df.iat[index.row(), index.column()]
+        if pd.isnull(value):
+            return "N/A"
+        if isinstance(value, float):
+            return f"{value:.2f}"
+        return str(value)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column < 0 or self.df.empty:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.df = self.df.sort_values(self.df.columns[column], ascending=order == Qt.AscendingOrder,
+                                      kind="stable", na_position="last").reset_index(drop=True)
+        self.layoutChanged.emit()
+
+
+class ReportDialog(QDialog):
+    def __init__(self, title, df, filename, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(900, 550)
+        self.df = df
+        self.filename = filename
+
+        layout = QVBoxLayout(self)
+        self.model = ReportTableModel(df, self)
+        table = QTableView()
+        table.setModel(self.model)
+        table.setSortingEnabled(True)
+        table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        table.setAlternatingRowColors(True)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(table.NoEditTriggers)
+        table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(table, 1)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(QLabel(f"{len(df)} rows"))
+        buttons.addStretch(1)
+        export_btn = QPushButton("Export to CSV")
+        export_btn.clicked.connect(self.export)
+        buttons.addWidget(export_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.accept)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+    def export(self):
+        # Exports in the order currently shown
+        try:
+            self.model.df.to_csv(self.filename, index=False)
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", str(e))
+            return
+        QMessageBox.information(self, "Success", f"Report exported to {self.filename}")
+
+
 class AttendanceWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -23,6 +269,15 @@ class AttendanceWindow(QMainWindow):
             pass
 
         self.attendance_system = None
+        # Records currently shown in the table, reused by Export
+        self.current_records = None
+        self.current_range = None
+
+        # One device job at a time; the device lock in ZKTecoAttendance keeps
+        # jobs and the background sync thread off the socket at the same time.
+        self.job_pool = QThreadPool(self)
+        self.job_pool.setMaxThreadCount(1)
+        self.current_job = None
 
         # -------- Menu Bar (with icon space) --------
         menu_bar = self.menuBar()
@@ -85,7 +340,17 @@ class AttendanceWindow(QMainWindow):
         self.retrieve_btn.clicked.connect(self.retrieve_records)
         date_layout.addWidget(self.retrieve_btn)
 
-        self.export_btn = QPushButton("Export to CSV")
+        self.refresh_btn = QPushButton("Refresh from Device")
+        self.refresh_btn.setEnabled(False)
+        self.refresh_btn.clicked.connect(self.refresh_records)
+        date_layout.addWidget(self.refresh_btn)
+
+        self.export_format = QComboBox()
+        for fmt, (label, _) in EXPORT_FORMATS.items():
+            self.export_format.addItem(label, fmt)
+        date_layout.addWidget(self.export_format)
+
+        self.export_btn = QPushButton("Export")
         self.export_btn.setEnabled(False)
         self.export_btn.clicked.connect(self.export_records)
         date_layout.addWidget(self.export_btn)
@@ -93,28 +358,47 @@ class AttendanceWindow(QMainWindow):
         date_layout.addStretch(1)
         left_col.addWidget(date_group)
 
+        # Reports Box: summaries from the local rollups, no device read
+        report_group = QGroupBox("Reports")
+        report_layout = QHBoxLayout(report_group)
+        report_layout.addWidget(QLabel("Report:"))
+        self.report_combo = QComboBox()
+        for kind, label in REPORTS:
+            self.report_combo.addItem(label, kind)
+        report_layout.addWidget(self.report_combo)
+
+        self.report_btn = QPushButton("Show Report")
+        self.report_btn.setEnabled(False)
+        self.report_btn.clicked.connect(self.show_report)
+        report_layout.addWidget(self.report_btn)
+        report_layout.addStretch(1)
+        left_col.addWidget(report_group)
+
         # Attendance Records Table
-        self.table = QTableWidget(0, 6)
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter by name or user ID")
+        self.filter_edit.textChanged.connect(self.apply_filter)
+        left_col.addWidget(self.filter_edit)
+
+        self.table_model = AttendanceTableModel(self)
+        self.table_proxy = AttendanceFilterProxy(self)
+        self.table_proxy.setSourceModel(self.table_model)
+        self.table = QTableView()
+        self.table.setModel(self.table_proxy)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.table.setAlternatingRowColors(True)
-        self.table.setHorizontalHeaderLabels([
-            "User ID", "Name", "Date", "Check In", "Check Out", "Duration (hours)"
-        ])
         self.table.verticalHeader().setVisible(False)
         self.table.setSelectionBehavior(self.table.SelectRows)
         self.table.setEditTriggers(self.table.NoEditTriggers)
         self.table.horizontalHeader().setStretchLastSection(True)
 
-        try:
-            from PyQt5.QtWidgets import QHeaderView
-            header = self.table.horizontalHeader()
-            header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
-            header.setSectionResizeMode(1, QHeaderView.Stretch)
-            header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
-            header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
-            header.setSectionResizeMode(4, QHeaderView.ResizeToContents)
-            header.setSectionResizeMode(5, QHeaderView.ResizeToContents)
-        except Exception:
-            pass
+        # Fixed widths: ResizeToContents would measure every cell of every row
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+        for col, width in ((0, 80), (2, 100), (3, 160), (4, 160)):
+            header.resizeSection(col, width)
 
         left_col.addWidget(self.table, 1)
         left_wrap = QWidget()
@@ -136,13 +420,17 @@ class AttendanceWindow(QMainWindow):
             "  2) Watch status bar for ‘Connected’ confirmation.\n\n"
             "C. Retrieve Logs\n"
             "  1) Select Start and End dates.\n"
-            "  2) Click ‘Retrieve Records’ to populate the table.\n\n"
+            "  2) Click ‘Retrieve Records’ to populate the table from the local cache.\n"
+            "  3) Click ‘Refresh from Device’ to re-read the device first.\n\n"
             "D. Export\n"
-            "  1) Click ‘Export to CSV’ to save filtered records.\n"
+            "  1) Choose CSV, gzip CSV or Parquet and click ‘Export’ to save\n the date range shown in the table.\n"
             "  2) Use Excel or Google Sheets for analysis.\n\n"
-            "E. Pro Tips\n"
+            "E. Reports\n"
+            "  1) Pick a report and date range, click ‘Show Report’.\n"
+            "  2) Reports use the local totals and export from their window.\n\n"
+            "F. Pro Tips\n"
             "  • Sync happens automatically only on Sunday, Monday, Wednesday, and Friday.\n"
-            "  • Keep device clock accurate.\n"
+            "  • Clock drift is measured and corrected on sync, but keep the device clock accurate.\n"
             "  • Static IP must be set to prevent random disconnections.\n"
         )
         steps_layout.addWidget(self.steps_text)
@@ -151,6 +439,25 @@ class AttendanceWindow(QMainWindow):
         self.setCentralWidget(central)
         self.statusBar().showMessage("Not connected")
 
+        # Job progress and cancellation live in the status bar
+        self.job_progress = QProgressBar()
+        self.job_progress.setRange(0, 0)
+        self.job_progress.setMaximumWidth(160)
+        self.job_progress.setVisible(False)
+        self.statusBar().addPermanentWidget(self.job_progress)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setVisible(False)
+        self.cancel_btn.clicked.connect(self.cancel_job)
+        self.statusBar().addPermanentWidget(self.cancel_btn)
+
+        # Live sync pipeline numbers, refreshed from the metrics registry
+        self.metrics_label = QLabel()
+        self.metrics_label.setStyleSheet("font-size:9pt;color:#555;")
+        self.statusBar().addPermanentWidget(self.metrics_label)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(2000)
+
         # UI Styling
         self.setStyleSheet(
             "QMainWindow{background:#F7F9FC;}"
@@ -165,87 +472,207 @@ class AttendanceWindow(QMainWindow):
             "background:#FFFFFF;font-weight:600;}"
             "QPushButton:hover{background:#F6F8FF;}"
             "QPushButton:disabled{color:#888;background:#F0F2F6;}"
-            "QTableWidget{background:#FFFFFF;border:1px solid #D9DEE7;border-radius:8px;"
+            "QTableView{background:#FFFFFF;border:1px solid #D9DEE7;border-radius:8px;"
             "gridline-color:#EDF1F7;}"
             "QHeaderView::section{background:#FBFCFE;border:none;border-bottom:1px solid #E6EBF3;"
             "padding:6px;font-weight:600;}"
-            "QTableWidget::item:selected{background:#162761;}"
+            "QTableView::item:selected{background:#162761;}"
         )
 
+    # -------- Jobs --------
+    def start_job(self, fn, on_finished, error_title="Error"):
+        if self.current_job is not None:
+            self.statusBar().showMessage("Please wait for the current operation to finish")
+            return False
+        job = DeviceJob(fn)
+        job.signals.progress.connect(self.statusBar().showMessage)
+        job.signals.percent.connect(self.on_job_percent)
+        job.signals.finished.connect(on_finished)
+        job.signals.failed.connect(lambda message: self.on_job_failed(error_title, message))
+        job.signals.cancelled.connect(lambda: self.statusBar().showMessage("Cancelled"))
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(self.on_job_done)
+
+        self.current_job = job
+        self.set_busy(True)
+        self.job_pool.start(job)
+        return True
+
+    def cancel_job(self):
+        if self.current_job is not None:
+            self.current_job.cancel()
+            self.statusBar().showMessage("Cancelling…")
+
+    def on_job_failed(self, title, message):
+        QMessageBox.critical(self, title, message)
+        self.statusBar().showMessage(f"{title}: {message}")
+
+    def on_job_percent(self, percent):
+        self.job_progress.setRange(0, 100)
+        self.job_progress.setValue(percent)
+
+    def on_job_done(self, *args):
+        self.current_job = None
+        self.job_progress.setRange(0, 0)
+        self.set_busy(False)
+
+    def set_busy(self, busy):
+        connected = bool(self.attendance_system and getattr(self.attendance_system, 'conn', None))
+        self.job_progress.setVisible(busy)
+        self.cancel_btn.setVisible(busy)
+        self.connect_btn.setEnabled(not busy and not connected)
+        self.retrieve_btn.setEnabled(not busy and connected)
+        self.refresh_btn.setEnabled(not busy and connected)
+        self.report_btn.setEnabled(not busy and connected)
+        self.export_btn.setEnabled(not busy and self.current_records is not None)
+
     # -------- Logic --------
     def connect_device(self):
-        try:
-            ip = self.ip_edit.text().strip()
-            port = int(self.port_edit.text().strip() or 4370)
-            self.attendance_system = ZKTecoAttendance(ip, port=port)
-            self.attendance_system.connect()
-
-            if getattr(self.attendance_system, 'conn', None):
+        ip = self.ip_edit.text().strip()
+        port = int(self.port_edit.text().strip() or 4370)
+
+        def work(job):
+            job.report(f"Connecting to {ip}…")
+            system = ZKTecoAttendance(ip, port=port)
+            system.connect()
+            if job.is_cancelled():
+                system.disconnect()
+            return system
+
+        def done(system):
+            self.attendance_system = system
+            if getattr(system, 'conn', None):
                 self.statusBar().showMessage(f"Connected to {ip}")
-                self.connect_btn.setEnabled(False)
-                self.retrieve_btn.setEnabled(True)
             else:
                 self.statusBar().showMessage("Connection failed")
-        except Exception as e:
-            QMessageBox.critical(self, "Connection Error", str(e))
-            self.statusBar().showMessage("Connection failed")
 
-    def retrieve_records(self):
+        self.start_job(work, done, "Connection Error")
+
+    def retrieve_records(self, refresh=False):
         if not self.attendance_system or not getattr(self.attendance_system, 'conn', None):
             QMessageBox.critical(self, "Error", "Please connect to the device first")
             return
-        try:
-            self.table.setRowCount(0)
-            start_date = self.start_date.date().toPyDate()
-            end_date = self.end_date.date().toPyDate()
-            records = self.attendance_system.get_attendance(start_date, end_date)
-
+        system = self.attendance_system
+        start_date = self.start_date.date().toPyDate()
+        end_date = self.end_date.date().toPyDate()
+
+        def work(job):
+            if refresh:
+                job.report("Reading attendance log from device…")
+                if system.refresh_from_device() is None:
+                    raise RuntimeError("Could not read attendance records from the device")
+                if job.is_cancelled():
+                    return None
+            job.report("Grouping records…")
+            return system.get_attendance(start_date, end_date)
+
+        def done(records):
             if records is not None and not records.empty:
                 self.populate_table(records)
+                self.current_records = records
+                self.current_range = (start_date, end_date)
                 self.statusBar().showMessage(f"Retrieved {len(records)} records")
-                self.export_btn.setEnabled(True)
             else:
+                self.current_records = None
+                self.populate_table(None)
                 self.statusBar().showMessage("No records found")
-                self.export_btn.setEnabled(False)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
-            self.statusBar().showMessage("Error retrieving records")
+
+        self.start_job(work, done)
+
+    def refresh_records(self):
+        # Re-read the device instead of answering from the local cache
+        self.retrieve_records(refresh=True)
 
     def populate_table(self, df: pd.DataFrame):
-        expected_cols = ["user_id", "user_name", "date", "check_in", "check_out", "duration"]
-        for col in expected_cols:
-            if col not in df.columns:
-                df[col] = pd.NA
-
-        self.table.setRowCount(len(df))
-        for r, (_, row) in enumerate(df.iterrows()):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["user_id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(str(row["user_name"])))
-            self.table.setItem(r, 2, QTableWidgetItem(str(row["date"])))
-            self.table.setItem(r, 3, QTableWidgetItem(str(row["check_in"])))
-            self.table.setItem(r, 4, QTableWidgetItem(str(row["check_out"])))
-            duration = f"{row['duration']:.2f}" if pd.notnull(row['duration']) else "N/A"
-            self.table.setItem(r, 5, QTableWidgetItem(duration))
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table_model.set_frame(df)
+        self.table_proxy.set_filter_text(self.filter_edit.text())
+
+    def apply_filter(self, text):
+        self.table_proxy.set_filter_text(text)
 
     def export_records(self):
-        if not self.attendance_system or not getattr(self.attendance_system, 'conn', None):
-            QMessageBox.critical(self, "Error", "Please connect to the device first")
+        # Streams the range shown in the table from the local rollups in
+        # chunks; no second device download and no full in-memory copy
+        records = self.current_records
+        if records is None or records.empty:
+            self.statusBar().showMessage("No records to export")
             return
-        try:
-            start_date = self.start_date.date().toPyDate()
-            end_date = self.end_date.date().toPyDate()
-            records = self.attendance_system.get_attendance(start_date, end_date)
+        system = self.attendance_system
+        start_date, end_date = self.current_range
+        fmt = self.export_format.currentData()
+        filename = f"attendance_records_{start_date}_{end_date}{EXPORT_FORMATS[fmt][1]}"
 
-            if records is not None and not records.empty:
-                filename = f"attendance_records_{start_date}_{end_date}.csv"
-                records.to_csv(filename, index=False)
-                self.statusBar().showMessage(f"Exported to {filename}")
-                QMessageBox.information(self, "Success", f"Records exported to {filename}")
-            else:
-                self.statusBar().showMessage("No records to export")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
-            self.statusBar().showMessage("Error exporting records")
+        def work(job):
+            job.report(f"Writing {filename}…", 0)
+
+            def progress(written, total):
+                job.report(f"Writing {filename}… {written}/{total} rows",
+                           100 * written / total if total else None)
+
+            if system.export_attendance(filename, fmt, start_date, end_date,
+                                        progress, job.is_cancelled) is None:
+                return None
+            return filename
+
+        def done(filename):
+            self.statusBar().showMessage(f"Exported to {filename}")
+            QMessageBox.information(self, "Success", f"Records exported to {filename}")
+
+        self.start_job(work, done, "Export Error")
+
+    def show_report(self):
+        if not self.attendance_system:
+            QMessageBox.critical(self, "Error", "Please connect to the device first")
+            return
+        system = self.attendance_system
+        kind = self.report_combo.currentData()
+        title = self.report_combo.currentText()
+        start_date = self.start_date.date().toPyDate()
+        end_date = self.end_date.date().toPyDate()
+
+        def work(job):
+            job.report(f"Building {title.lower()} report…")
+            report = system.get_report(kind, start_date, end_date)
+            if report is None:
+                raise RuntimeError(f"Could not build the {title.lower()} report")
+            return report
+
+        def done(report):
+            if report.empty:
+                self.statusBar().showMessage("No attendance in the selected range")
+                return
+            self.statusBar().showMessage(f"{title}: {len(report)} rows")
+            filename = f"{kind}_report_{start_date}_{end_date}.csv"
+            ReportDialog(f"{title} ({start_date} to {end_date})", report, filename, self).exec_()
+
+        self.start_job(work, done, "Report Error")
+
+    def update_metrics(self):
+        m = sync_metrics.summary()
+        parts = []
+        if m["fetch_seconds"] is not None:
+            parts.append(f"Fetch {m['fetch_seconds']:.2f}s")
+        if m["upload_seconds"] is not None:
+            parts.append(f"Upload {m['upload_seconds']:.2f}s")
+        if m["records_new"] or m["records_skipped"]:
+            parts.append(f"New {m['records_new']} / skipped {m['records_skipped']}")
+        if m["uploaded"] or m["upload_errors"]:
+            parts.append(f"Sent {m['uploaded']} ({m['upload_errors']} errors)")
+        if m["outbox_depth"] is not None:
+            parts.append(f"Outbox {m['outbox_depth']}")
+        if m["checkpoint_lag"] is not None:
+            parts.append(f"Lag {m['checkpoint_lag']:.0f}s")
+        self.metrics_label.setText("  ·  ".join(parts))
+
+    def closeEvent(self, event):
+        self.metrics_timer.stop()
+        if self.current_job is not None:
+            self.current_job.cancel()
+        self.job_pool.waitForDone()
+        if self.attendance_system:
+            self.attendance_system.disconnect()
+        super().closeEvent(event)
 
     def show_about_dialog(self):
         QMessageBox.information(
@@ -256,6 +683,7 @@ class AttendanceWindow(QMainWindow):
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     app = QApplication(sys.argv)
     win = AttendanceWindow()
     win.show()
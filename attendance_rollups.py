@@ -0,0 +1,314 @@
+import logging
+import sqlite3
+import threading
+
+from punch_cache import SCHEMA as PUNCH_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+
+# Service days as Python weekdays: Sunday(6), Monday(0), Wednesday(2), Friday(4)
+SERVICE_DAYS = {6, 0, 2, 4}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_dirty (
+    device_serial TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    PRIMARY KEY (device_serial, user_id, date)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS punches_rollup_dirty AFTER INSERT ON punches BEGIN
+    INSERT OR IGNORE INTO rollup_dirty (device_serial, user_id, date)
+    VALUES (NEW.device_serial, NEW.user_id, substr(NEW.timestamp, 1, 10));
+END;
+CREATE TABLE IF NOT EXISTS daily_attendance (
+    device_serial TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    check_in TEXT,
+    check_out TEXT,
+    hours REAL,
+    punches INTEGER NOT NULL,
+    PRIMARY KEY (device_serial, user_id, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_user ON daily_attendance (user_id, date);
+CREATE INDEX IF NOT EXISTS daily_date ON daily_attendance (date);
+CREATE TABLE IF NOT EXISTS day_totals (
+    date TEXT PRIMARY KEY,
+    members INTEGER NOT NULL,
+    hours REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS period_totals (
+    period TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    days_present INTEGER NOT NULL,
+    services INTEGER NOT NULL,
+    hours REAL,
+    PRIMARY KEY (period, period_start, user_id)
+) WITHOUT ROWID;
+"""
+
+# Per-user-per-day buckets touched since the last refresh, rebuilt from punches
+REBUILD_DAILY = """
+INSERT OR REPLACE INTO daily_attendance
+    (device_serial, user_id, date, check_in, check_out, hours, punches)
+SELECT device_serial, user_id, date, check_in, check_out,
+       (strftime('%s', check_out) - strftime('%s', check_in)) / 3600.0, punches
+FROM (
+    SELECT b.device_serial, b.user_id, b.date,
+           MAX(CASE WHEN p.punch = 0 THEN p.timestamp END) AS check_in,
+           MAX(CASE WHEN p.punch = 1 THEN p.timestamp END) AS check_out,
+           COUNT(*) AS punches
+    FROM temp.rollup_batch b
+    JOIN punches p ON p.device_serial = b.device_serial AND p.user_id = b.user_id
+                  AND p.timestamp >= b.date AND p.timestamp < date(b.date, '+1 day')
+    GROUP BY b.device_serial, b.user_id, b.date
+)
+"""
+
+REBUILD_DAYS = """
+INSERT INTO day_totals (date, members, hours)
+SELECT date, COUNT(DISTINCT user_id), SUM(hours)
+FROM daily_attendance
+WHERE check_in IS NOT NULL AND date IN (SELECT DISTINCT date FROM temp.rollup_batch)
+GROUP BY date
+"""
+
+# Week buckets start on Sunday, the first service of the week
+AFFECTED_PERIODS = """
+INSERT INTO temp.rollup_periods (period, start, end, user_id)
+SELECT DISTINCT 'week', date(date, '-6 days', 'weekday 0'),
+       date(date, '-6 days', 'weekday 0', '+7 days'), user_id
+FROM temp.rollup_batch
+UNION
+SELECT DISTINCT 'month', date(date, 'start of month'),
+       date(date, 'start of month', '+1 month'), user_id
+FROM temp.rollup_batch
+"""
+
+REBUILD_PERIODS = """
+INSERT INTO period_totals (period, period_start, user_id, days_present, services, hours)
+SELECT a.period, a.start, a.user_id, COUNT(DISTINCT d.date),
+       COUNT(DISTINCT CASE WHEN strftime('%w', d.date) IN ({service_days}) THEN d.date END),
+       SUM(d.hours)
+FROM temp.rollup_periods a
+JOIN daily_attendance d ON d.user_id = a.user_id AND d.date >= a.start AND d.date < a.end
+                       AND d.check_in IS NOT NULL
+GROUP BY a.period, a.start, a.user_id
+"""
+
+
+def _day(value):
+    # 'YYYY-MM-DD' for a date, datetime or ISO string
+    if value is None:
+        return None
+    return value.isoformat()[:10] if hasattr(value, "isoformat") else str(value)[:10]
+
+
+class AttendanceRollups:
+    # Daily, per-service-day and weekly/monthly attendance totals kept next to
+    # the punch cache. A trigger on punches marks the user/day buckets each new
+    # punch touches; refresh() rebuilds only those buckets and the day and
+    # period totals that contain them.
+    def __init__(self, path="attendance.db", service_days=SERVICE_DAYS):
+        self.path = path
+        self.service_days = set(service_days)
+        # SQLite strftime('%w') counts from Sunday = 0, Python weekday() from Monday = 0
+        self._service_sql = ",".join(f"'{(day + 1) % 7}'" for day in sorted(self.service_days))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(PUNCH_SCHEMA)
+        new = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_attendance'").fetchone() is None
+        self._db.executescript(SCHEMA)
+        self._db.executescript("""
+            CREATE TEMP TABLE IF NOT EXISTS rollup_batch (device_serial, user_id, date);
+            CREATE TEMP TABLE IF NOT EXISTS rollup_periods (period, start, end, user_id);
+        """)
+        if new:
+            # Punches cached before the rollups existed
+            self._db.execute(
+                "INSERT OR IGNORE INTO rollup_dirty (device_serial, user_id, date) "
+                "SELECT DISTINCT device_serial, user_id, substr(timestamp, 1, 10) FROM punches")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ------------------ MAINTENANCE ------------------
+    def refresh(self):
+        # Rebuild the buckets touched since the last refresh; returns how many
+        # user/day buckets were recomputed
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM temp.rollup_batch")
+                self._db.execute("INSERT INTO temp.rollup_batch SELECT device_serial, user_id, date FROM rollup_dirty")
+                count = self._db.execute("SELECT COUNT(*) FROM temp.rollup_batch").fetchone()[0]
+                if count:
+                    self._db.execute("DELETE FROM rollup_dirty")
+                    self._db.execute(REBUILD_DAILY)
+                    self._db.execute(
+                        "DELETE FROM day_totals WHERE date IN (SELECT DISTINCT date FROM temp.rollup_batch)")
+                    self._db.execute(REBUILD_DAYS)
+                    self._db.execute("DELETE FROM temp.rollup_periods")
+                    self._db.execute(AFFECTED_PERIODS)
+                    self._db.execute(
+                        "DELETE FROM period_totals WHERE (period, period_start, user_id) IN "
+                        "(SELECT period, start, user_id FROM temp.rollup_periods)")
+                    self._db.execute(REBUILD_PERIODS.format(service_days=self._service_sql))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if count:
+            logger.info(f"Updated attendance rollups for {count} member days")
+        return count
+
+    def rebuild(self):
+        # Recompute everything from the punch cache
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO rollup_dirty (device_serial, user_id, date) "
+                "SELECT DISTINCT device_serial, user_id, substr(timestamp, 1, 10) FROM punches")
+        return self.refresh()
+
+    # ------------------ REPORTS ------------------
+    def _rows(self, sql, params):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _range(self, column, start, end):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(_day(start))
+        if end is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(_day(end))
+        return clauses, params
+
+    def _names(self, frame, users):
+        users = users or {}
+        frame.insert(frame.columns.get_loc('user_id') + 1, 'user_name',
+                     frame['user_id'].map(users).fillna("Unknown"))
+        return frame
+
+    def _daily_filter(self, start, end, device_serial):
+        clauses, params = self._range("date", start, end)
+        clauses.append("check_in IS NOT NULL")
+        if device_serial is not None:
+            clauses.append("device_serial = ?")
+            params.append(device_serial)
+        return " AND ".join(clauses), params
+
+    def count_daily(self, start=None, end=None, device_serial=None):
+        where, params = self._daily_filter(start, end, device_serial)
+        return self._rows(f"SELECT COUNT(*) FROM daily_attendance WHERE {where}", params)[0][0]
+
+    def iter_daily(self, start=None, end=None, device_serial=None, users=None, chunk_size=50_000):
+        # Grouped attendance in get_attendance() layout, ordered by user and
+        # date, as DataFrames of at most chunk_size rows. Pages are fetched by
+        # key so only one chunk is held and the lock is released between them.
+        import pandas as pd
+        where, params = self._daily_filter(start, end, device_serial)
+        sql = ("SELECT user_id, date, check_in, check_out, hours, device_serial FROM daily_attendance "
+               f"WHERE {where} AND (user_id, date, device_serial) > (?, ?, ?) "
+               "ORDER BY user_id, date, device_serial LIMIT ?")
+        after = ("", "", "")
+        while True:
+            rows = self._rows(sql, params + list(after) + [chunk_size])
+            if not rows:
+                return
+            after = (rows[-1][0], rows[-1][1], rows[-1][5])
+            user_ids, dates, check_ins, check_outs, hours, _ = zip(*rows)
+            frame = pd.DataFrame({
+                'user_id': list(user_ids),
+                'date': pd.to_datetime(pd.Series(dates)).dt.date,
+                'check_in': pd.to_datetime(pd.Series(check_ins, dtype=object), format="ISO8601"),
+                'check_out': pd.to_datetime(pd.Series(check_outs, dtype=object), format="ISO8601"),
+                'duration': pd.Series(hours, dtype="float64"),
+            })
+            yield self._names(frame, users)
+            if len(rows) < chunk_size:
+                return
+
+    def service_days_report(self, start=None, end=None):
+        # Members present and hours per service day
+        import pandas as pd
+        clauses, params = self._range("date", start, end)
+        sql = "SELECT date, members, hours FROM day_totals"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        frame = pd.DataFrame(self._rows(sql + " ORDER BY date", params),
+                             columns=['date', 'members', 'hours'])
+        dates = pd.to_datetime(frame['date'])
+        frame = frame[dates.dt.weekday.isin(self.service_days)].reset_index(drop=True)
+        frame.insert(1, 'day', pd.to_datetime(frame['date']).dt.day_name())
+        return frame
+
+    def period_report(self, period="week", start=None, end=None, users=None):
+        # Per member per week (starting Sunday) or per calendar month
+        import pandas as pd
+        if period not in ("week", "month"):
+            raise ValueError(f"period must be 'week' or 'month', not {period!r}")
+        clauses, params = self._range("period_start", start, end)
+        sql = ("SELECT period_start, user_id, days_present, services, hours FROM period_totals "
+               "WHERE period = ?")
+        if clauses:
+            sql += " AND " + " AND ".join(clauses)
+        frame = pd.DataFrame(self._rows(sql + " ORDER BY period_start, user_id", [period] + params),
+                             columns=['period_start', 'user_id', 'days_present', 'services', 'hours'])
+        return self._names(frame, users)
+
+    def member_summary(self, start=None, end=None, users=None):
+        # Services attended, hours and attendance streaks per member
+        import pandas as pd
+        clauses, params = self._range("date", start, end)
+        sql = ("SELECT user_id, date, SUM(hours) FROM daily_attendance WHERE check_in IS NOT NULL"
+               + "".join(" AND " + c for c in clauses) + " GROUP BY user_id, date")
+        days = pd.DataFrame(self._rows(sql, params), columns=['user_id', 'date', 'hours'])
+        columns = ['user_id', 'days_present', 'services', 'hours', 'first_seen', 'last_seen',
+                   'longest_streak', 'current_streak']
+        if days.empty:
+            return self._names(pd.DataFrame(columns=columns), users)
+
+        days['weekday'] = pd.to_datetime(days['date']).dt.weekday
+        days['service'] = days['weekday'].isin(self.service_days)
+        summary = days.groupby('user_id').agg(
+            days_present=('date', 'size'), services=('service', 'sum'), hours=('hours', 'sum'),
+            first_seen=('date', 'min'), last_seen=('date', 'max'))
+
+        # Streaks count consecutive services held in the range, not calendar days
+        held = self.service_days_report(start, end)
+        held = held.loc[held['members'] > 0, 'date']
+        position = pd.Series(range(len(held)), index=held.values)
+        attended = days[days['service'] & days['date'].isin(position.index)][['user_id', 'date']].copy()
+        attended['pos'] = attended['date'].map(position)
+        attended = attended.sort_values(['user_id', 'pos'])
+        attended['run'] = attended['pos'] - attended.groupby('user_id').cumcount()
+        runs = attended.groupby(['user_id', 'run'])['pos'].agg(['size', 'max'])
+        summary['longest_streak'] = runs['size'].groupby('user_id').max()
+        last = len(held) - 1
+        current = runs[runs['max'] == last]['size'].droplevel('run')
+        summary['current_streak'] = current
+        summary[['longest_streak', 'current_streak']] = (
+            summary[['longest_streak', 'current_streak']].fillna(0).astype(int))
+        summary = summary.reset_index().sort_values('services', ascending=False, kind='stable')
+        return self._names(summary[columns].reset_index(drop=True), users)
+
+    def year_over_year(self, start=None, end=None):
+        # Service attendances per month, one column per year
+        import pandas as pd
+        clauses, params = self._range("period_start", start, end)
+        sql = ("SELECT substr(period_start, 1, 4), CAST(substr(period_start, 6, 2) AS INTEGER), "
+               "SUM(services) FROM period_totals WHERE period = 'month'"
+               + "".join(" AND " + c for c in clauses) + " GROUP BY 1, 2")
+        frame = pd.DataFrame(self._rows(sql, params), columns=['year', 'month', 'services'])
+        table = frame.pivot(index='month', columns='year', values='services').fillna(0).astype(int)
+        table.index = [pd.Timestamp(2000, m, 1).strftime('%B') for m in table.index]
+        table.columns = [str(c) for c in table.columns]
+        return table.rename_axis('month').reset_index()
@@ -1,176 +1,364 @@
-from zk import ZK, const
-import pandas as pd
-from dateutil import parser
-from datetime import datetime, time, timezone, timedelta
+import calendar
+import logging
+from datetime import datetime, time
 import threading
 import time as time_module
-import requests
 import os
+import numpy as np
+from device_connection import DeviceConnection
+from sync_sender import LogSender
+from sync_outbox import Outbox
+from device_fetch import IncrementalFetcher
+from punch_cache import PunchCache
+from sync_dedup import AckIndex, fingerprint
+from attendance_rollups import AttendanceRollups
+from attendance_export import export_chunks
+from punch_store import PunchStore, to_epoch, from_epoch
+from poll_schedule import PollSchedule, day_windows
+from user_directory import UserDirectory, enrollment_signature
+from device_clock import DeviceClock
+from sync_metrics import (DEVICE_FETCH_SECONDS, RECORDS_FETCHED, RECORDS_NEW,
+                          RECORDS_SKIPPED, DEVICE_ERRORS, CHECKPOINT_LAG)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://coc4towns-attendance.vercel.app/api/attendance/device"
+DEFAULT_API_KEY = "super-secret-key-here"
+
+# Default service days when no windows are configured: Sunday(6), Monday(0),
+# Wednesday(2), Friday(4)
+ALLOWED_DAYS = {6, 0, 2, 4}
+
+
+# ------------------ GROUPING ------------------
+def attendance_frame(attendance):
+    # Columnar frame straight from the device's Attendance objects
+    import pandas as pd
+    if isinstance(attendance, PunchStore):
+        return attendance.frame()[['user_id', 'timestamp', 'punch']]
+    return pd.DataFrame({
+        'user_id': [att.user_id for att in attendance],
+        'timestamp': [att.timestamp for att in attendance],
+        'punch': [att.punch for att in attendance],
+    })
+
+
+def group_attendance(df, users):
+    # One row per user per day holding the last check-in and last check-out;
+    # days without a check-in are dropped.
+    import pandas as pd
+    keys = [df['user_id'], df['timestamp'].dt.normalize().rename('date')]
+    punches = df.groupby([*keys, df['punch']], sort=False, observed=True)['timestamp'].max().unstack('punch')
+    if 0 not in punches.columns:
+        return pd.DataFrame()
+    grouped = pd.DataFrame({'check_in': punches[0]})
+    grouped['check_out'] = punches[1] if 1 in punches.columns else pd.NaT
+    grouped = grouped[grouped['check_in'].notna()].sort_index().reset_index()
+    if grouped.empty:
+        return pd.DataFrame()
+
+    result_df = pd.DataFrame({
+        'user_id': grouped['user_id'],
+        'user_name': grouped['user_id'].astype(str).map(users).fillna("Unknown"),
+        'date': grouped['date'].dt.date,
+        'check_in': grouped['check_in'],
+        'check_out': grouped['check_out'],
+    })
+    result_df['duration'] = (result_df['check_out'] - result_df['check_in']).dt.total_seconds() / 3600
+    if result_df['check_out'].isna().all():
+        # Matches the per-row construction, which leaves these as None objects
+        result_df['check_out'] = None
+        result_df['duration'] = None
+    return result_df
 
 
-LAGOS_TZ = timezone(timedelta(hours=1))
-
 class ZKTecoAttendance:
     def __init__(self, ip_address, port=4370, timeout=5, password=0,
-                 api_url="https://coc4towns-attendance.vercel.app/api/attendance/device",
-                 api_key="super-secret-key-here", poll_interval=60):
+                 api_url=DEFAULT_API_URL, api_key=DEFAULT_API_KEY, poll_interval=5,
+                 idle_interval=3600, service_windows=None, schedule=None,
+                 batch_mode=None, batch_size=500, batch_max_bytes=256 * 1024,
+                 batch_url=None, upload_concurrency=4, db_path="attendance.db",
+                 live_capture=False, last_sync_file="last_sync.txt", auto_sync=True,
+                 sender=None, outbox=None, cache=None, rollups=None, dedup=None, directory=None,
+                 clock=None, clock_resync=False, keepalive_interval=15, shutdown_timeout=30):
         self.ip_address = ip_address
         self.port = port
         self.timeout = timeout
         self.password = password
-        self.zk = ZK(self.ip_address, port=self.port, timeout=self.timeout, password=self.password)
-        self.conn = None
+        # One supervised device session for user loads, manual fetches and sync
+        self.connection = DeviceConnection(ip_address, port=port, timeout=timeout, password=password,
+                                           keepalive_interval=keepalive_interval)
+        self.zk = self.connection.zk
+        # user_id (as a string) → name, from the persisted directory; refreshed
+        # from the device only when its enrollment counts change
         self.users = {}
+        self.directory = directory or UserDirectory(db_path)
+        # Ids the device did not know either → enrollment signature of the
+        # download that missed them; asked again only once enrollment changes
+        self._unresolved = {}
+        self._users_lock = threading.RLock()
+        self.device_serial = None
+        # Only downloads the attendance table when the device record count changes
+        self.fetcher = IncrementalFetcher()
+        # Device clock skew, measured on connect and every poll; punch times are
+        # corrected for it before they are cached or queued
+        self.clock = clock or DeviceClock(db_path, resync=clock_resync)
+        self.live_capture = live_capture
 
         # Sync-related
         self.api_url = api_url
         self.api_key = api_key
         self.poll_interval = poll_interval
-        self.last_sync_file = "last_sync.txt"
+        # Polls every poll_interval inside service windows, idle_interval outside;
+        # the windows' days are also the days whose punches are uploaded
+        self.schedule = schedule or PollSchedule(service_windows or day_windows(ALLOWED_DAYS),
+                                                 active_interval=poll_interval,
+                                                 idle_interval=idle_interval)
+        self.last_sync_file = last_sync_file
         self.last_sync_time = None
         self.last_api_status = None
         self.sync_thread = None
         self.sync_running = False
+        self.shutdown_timeout = shutdown_timeout
+        self._stop = threading.Event()
+        # Set to cut the sync loop's sleep short
+        self._wake = threading.Event()
+        # Without auto_sync no sync thread is started; a DeviceFleet polls instead
+        self.auto_sync = auto_sync
+
+        # Pooled, concurrent uploader (batched when batch_url is set); may be shared by a fleet
+        self._owns_sender = sender is None
+        self.sender = sender or LogSender(api_url, api_key, concurrency=upload_concurrency,
+                                          batch_mode=batch_mode, batch_size=batch_size,
+                                          batch_max_bytes=batch_max_bytes, batch_url=batch_url)
+
+        # Durable queue between device reads and uploads
+        # Punches the API has acknowledged, so a resync only sends the true delta
+        self.dedup = dedup or (outbox.dedup if outbox else AckIndex(db_path))
+        self.outbox = outbox or Outbox(db_path, dedup=self.dedup)
+        self.drain_batch_size = 2000
+
+        # Local punch store for Retrieve / Export, filled by sync and manual refreshes
+        self.cache = cache or PunchCache(db_path)
+        # Daily / service-day / weekly / monthly totals, updated as punches are cached
+        self.rollups = rollups or AttendanceRollups(db_path, service_days=self.schedule.service_days)
 
     # ------------------ CONNECTION ------------------
+    @property
+    def conn(self):
+        # Live ZK connection, or None while disconnected or reconnecting
+        return self.connection.conn
+
     def connect(self):
         try:
-            self.conn = self.zk.connect()
-            self.load_users()
-            print(f"Successfully connected to device at {self.ip_address}")
+            self.connection.open()
+            with self.connection.session():
+                self.device_serial = self._read_serial()
+                self._sample_clock(self.conn)
+            # Cached names are usable at once; the device's user table is only
+            # downloaded in the background, and only if enrollment changed
+            self.users = self.directory.load(self.device_serial)
+            threading.Thread(target=self._refresh_users, daemon=True, name="user-refresh").start()
+            logger.info(f"Successfully connected to device at {self.ip_address}")
 
             # Start sync thread
             self.sync_running = True
-            self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
-            self.sync_thread.start()
+            self._stop.clear()
+            if self.auto_sync and not (self.sync_thread and self.sync_thread.is_alive()):
+                self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+                self.sync_thread.start()
         except Exception as e:
-            print(f"Error connecting to device: {str(e)}")
-            self.conn = None
+            logger.error(f"Error connecting to device: {str(e)}")
+            self.connection.close()
 
     def disconnect(self):
         self.sync_running = False
-        if self.conn:
-            self.conn.disconnect()
-            print("Disconnected from device")
-            self.conn = None
-            self.users = {}
+        self._stop.set()
+        self._wake.set()
+        conn = self.conn
+        if conn:
+            conn.end_live_capture = True
+        if self.sync_thread and self.sync_thread is not threading.current_thread():
+            self.sync_thread.join(self.shutdown_timeout)
+            if self.sync_thread.is_alive():
+                logger.warning("Sync thread did not stop in time")
+        self.sync_thread = None
+        if self._owns_sender:
+            self.sender.close()
+        self.fetcher.reset()
+        was_connected = conn is not None
+        self.connection.close()
+        if was_connected:
+            logger.info("Disconnected from device")
+        self.users = {}
+
+    def _read_serial(self):
+        try:
+            serial = self.conn.get_serialnumber()
+            if serial:
+                return serial
+        except Exception as e:
+            logger.error(f"Error reading device serial: {e}")
+        return f"{self.ip_address}:{self.port}"
 
     # ------------------ USERS ------------------
     def load_users(self):
+        # Full user list from the device, regardless of the enrollment counts
+        if not self.conn:
+            return
+        try:
+            with self.connection.session() as conn:
+                self._download_users(conn)
+        except Exception as e:
+            logger.error(f"Error loading users: {str(e)}")
+
+    def _refresh_users(self):
         if not self.conn:
             return
         try:
-            users = self.conn.get_users()
-            self.users = {user.user_id: user.name for user in users}
-            print(f"Loaded {len(self.users)} users from device")
+            with self.connection.session() as conn:
+                conn.read_sizes()
+                self._sync_users(conn)
         except Exception as e:
-            print(f"Error loading users: {str(e)}")
+            logger.error(f"Error refreshing users: {str(e)}")
+
+    def _download_users(self, conn, signature=None):
+        with self._users_lock:
+            if signature is None:
+                conn.read_sizes()
+                signature = enrollment_signature(conn)
+            users = {user.user_id: user.name for user in conn.get_users()}
+            self.users = self.directory.update(self.device_serial, users, signature)
+        logger.info(f"Loaded {len(self.users)} users from device")
+
+    def _unknown(self, user_ids):
+        signature = self.directory.signature(self.device_serial)
+        return {user_id for user_id in map(str, user_ids)
+                if user_id not in self.users and self._unresolved.get(user_id) != signature}
+
+    def _sync_users(self, conn, user_ids=()):
+        # Called with read_sizes() fresh on conn. Re-downloads the user table
+        # when the enrollment counts moved, or once for any batch of punches
+        # from ids the directory does not know.
+        with self._users_lock:
+            signature = enrollment_signature(conn)
+            unknown = self._unknown(user_ids)
+            if signature == self.directory.signature(self.device_serial) and not unknown:
+                return
+            self._download_users(conn, signature)
+            for user_id in unknown - self.users.keys():
+                self._unresolved[user_id] = signature
+
+    def resolve_users(self, user_ids):
+        # user_id → name covering user_ids as far as the device knows them, in
+        # at most one user table download
+        if self.conn and self._unknown(user_ids):
+            try:
+                with self.connection.session() as conn:
+                    conn.read_sizes()
+                    self._sync_users(conn, user_ids)
+            except Exception as e:
+                logger.warning(f"Could not resolve unknown users: {e}")
+        return self.users
+
+    def _named(self, frame):
+        # Second pass for reports that met ids the directory did not know
+        if frame is None or 'user_name' not in frame:
+            return frame
+        unknown = frame['user_name'] == "Unknown"
+        if unknown.any() and self._unknown(frame.loc[unknown, 'user_id'].unique()):
+            users = self.resolve_users(frame.loc[unknown, 'user_id'].unique())
+            frame['user_name'] = frame['user_id'].astype(str).map(users).fillna("Unknown")
+        return frame
 
     # ------------------ ATTENDANCE ------------------
     def get_attendance_status(self, punch):
         punch_map = {0: "Check In", 1: "Check Out"}
         return punch_map.get(punch, f"Unknown Punch ({punch})")
 
-    def get_attendance(self, start_date=None, end_date=None):
+    def refresh_from_device(self):
+        # Full device download into the local cache; returns the record count or None
         if not self.conn:
-            print("Not connected to device. Please connect first.")
+            logger.warning("Not connected to device. Please connect first.")
             return None
         try:
-            attendance = self.conn.get_attendance()
-            if not attendance:
-                print("No attendance records found")
-                return None
+            with self.connection.session() as conn:
+                attendance = self.fetcher.fetch_all(conn, force=True)
+            logger.info(f"Retrieved {len(attendance)} attendance records")
+            added = self.cache.add(self.device_serial, self.normalize(attendance))
+            if added:
+                logger.info(f"Cached {added} new attendance records")
+                self.rollups.refresh()
+            return len(attendance)
+        except Exception as e:
+            logger.error(f"Error retrieving attendance records: {str(e)}")
+            return None
 
-            print(f"Retrieved {len(attendance)} attendance records")
+    def get_attendance(self, start_date=None, end_date=None, refresh=False):
+        # Answered from the local cache; the device is only read when asked to
+        # refresh or when nothing has been cached for it yet.
+        if start_date and not isinstance(start_date, datetime):
+            start_date = datetime.combine(start_date, time.min)
+        if end_date and not isinstance(end_date, datetime):
+            end_date = datetime.combine(end_date, time.max)
+        if not (start_date and end_date):
+            start_date = end_date = None
 
-            if start_date and not isinstance(start_date, datetime):
-                start_date = datetime.combine(start_date, time.min)
-            if end_date and not isinstance(end_date, datetime):
-                end_date = datetime.combine(end_date, time.max)
+        try:
+            if refresh or not self.cache.has_data(self.device_serial):
+                if not self.refresh_from_device():
+                    logger.info("No attendance records found")
+                    return None
 
-            raw_records = []
-            for att in attendance:
-                dt = att.timestamp
-                if start_date and end_date:
-                    if not (start_date <= dt <= end_date):
-                        continue
-                user_name = self.users.get(str(att.user_id), "Unknown")
-                raw_records.append({
-                    'user_id': att.user_id,
-                    'user_name': user_name,
-                    'timestamp': dt,
-                    'raw_status': att.status,
-                    'punch': att.punch,
-                    'status': self.get_attendance_status(att.punch)
-                })
-
-            df = pd.DataFrame(raw_records)
+            df = self.cache.query(start_date, end_date, device_serial=self.device_serial)
             if df.empty:
                 return None
 
-            df = df.sort_values(['user_id', 'timestamp'])
-
-            grouped_records = []
-            current_user = None
-            current_date = None
-            check_in = None
-            check_out = None
-
-            for _, row in df.iterrows():
-                user_id = row['user_id']
-                user_name = row['user_name']
-                timestamp = row['timestamp']
-                date = timestamp.date()
-                punch = row['punch']
-
-                if current_user != user_id or current_date != date:
-                    if current_user is not None and check_in is not None:
-                        grouped_records.append({
-                            'user_id': current_user,
-                            'user_name': current_user_name,
-                            'date': current_date,
-                            'check_in': check_in,
-                            'check_out': check_out
-                        })
-                    current_user = user_id
-                    current_user_name = user_name
-                    current_date = date
-                    check_in = None
-                    check_out = None
-
-                if punch == 0:
-                    check_in = timestamp
-                elif punch == 1:
-                    check_out = timestamp
-
-            if current_user is not None and check_in is not None:
-                grouped_records.append({
-                    'user_id': current_user,
-                    'user_name': current_user_name,
-                    'date': current_date,
-                    'check_in': check_in,
-                    'check_out': check_out
-                })
-
-            result_df = pd.DataFrame(grouped_records)
+            result_df = group_attendance(df, self.resolve_users(df['user_id'].unique()))
 
+            logger.info(f"Grouped into {len(result_df)} attendance records")
             if not result_df.empty:
-                result_df['duration'] = result_df.apply(
-                    lambda row: (row['check_out'] - row['check_in']).total_seconds() / 3600 
-                    if pd.notnull(row['check_out']) else None,
-                    axis=1
-                )
-
-            print(f"\nGrouped into {len(result_df)} attendance records")
-            if not result_df.empty:
-                print("\nSample of grouped records:")
-                print(result_df.head())
+                logger.debug(f"Sample of grouped records:\n{result_df.head()}")
             return result_df
 
         except Exception as e:
-            print(f"Error retrieving attendance records: {str(e)}")
+            logger.error(f"Error retrieving attendance records: {str(e)}")
+            return None
+
+    # ------------------ REPORTS ------------------
+    REPORTS = ("members", "services", "weekly", "monthly", "yearly")
+
+    def get_report(self, kind, start_date=None, end_date=None):
+        # Summary reports answered from the rollups, without reading the device
+        try:
+            # Pick up punches cached by another process (e.g. the sync daemon)
+            self.rollups.refresh()
+            if kind == "members":
+                return self._named(self.rollups.member_summary(start_date, end_date, self.users))
+            if kind == "services":
+                return self.rollups.service_days_report(start_date, end_date)
+            if kind == "weekly":
+                return self._named(self.rollups.period_report("week", start_date, end_date, self.users))
+            if kind == "monthly":
+                return self._named(self.rollups.period_report("month", start_date, end_date, self.users))
+            if kind == "yearly":
+                return self.rollups.year_over_year(start_date, end_date)
+            raise ValueError(f"Unknown report {kind!r}, expected one of {self.REPORTS}")
+        except Exception as e:
+            logger.error(f"Error building {kind} report: {e}")
             return None
 
+    def export_attendance(self, path, fmt="csv", start_date=None, end_date=None,
+                          progress=None, should_stop=None, chunk_size=50_000):
+        # Stream grouped attendance for the range from the rollups to a CSV,
+        # gzip CSV or Parquet file in fixed-size chunks; memory stays flat
+        # however long the range is. Returns the row count, or None if cancelled.
+        self.rollups.refresh()
+        total = self.rollups.count_daily(start_date, end_date, self.device_serial)
+        chunks = self.rollups.iter_daily(start_date, end_date, self.device_serial,
+                                         self.users, chunk_size)
+        return export_chunks(chunks, path, fmt, total, progress, should_stop)
+
     # ------------------ SYNC LOGIC ------------------
     def _load_last_sync(self):
         try:
@@ -186,67 +374,228 @@ class ZKTecoAttendance:
             with open(self.last_sync_file, "w") as f:
                 f.write(ts.isoformat())
         except Exception as e:
-            print(f"Error saving last sync time: {e}")
+            logger.error(f"Error saving last sync time: {e}")
+
+    def poll_once(self):
+        # One device read into the cache and outbox, without uploading; used by DeviceFleet
+        if not self.conn:
+            raise ConnectionError(f"Not connected to device at {self.ip_address}")
+        return self._poll_device()
+
+    @property
+    def metrics_label(self):
+        return self.device_serial or self.ip_address
 
-    def _send_log(self, user_id, timestamp):
-        if timestamp.tzinfo is None:
-            timestamp = timestamp.replace(tzinfo=LAGOS_TZ)
-        payload = {"user_id": str(user_id), "timestamp": timestamp.isoformat()}
-        headers = {"x-api-key": self.api_key, "Content-Type": "application/json"}
+    def _poll_device(self):
+        # Fetch only what the device added since the last poll and queue it
+        return self._ingest(self._fetch_new())
+
+    def _fetch_new(self):
+        device = self.metrics_label
         try:
-            r = requests.post(self.api_url, json=payload, headers=headers, timeout=50)
-            self.last_api_status = f"{datetime.now()} → Status {r.status_code}"
-            print(f"Sent log {payload} → Status {r.status_code}")
+            with DEVICE_FETCH_SECONDS.time(device=device), self.connection.session() as conn:
+                self._sample_clock(conn)
+                # Corrected before any resync below changes the corrections
+                logs = self.normalize(self.fetcher.fetch_new(conn))
+                # The fetch refreshed the device counts, so this is free unless
+                # enrollment changed or the punches name unknown users
+                try:
+                    # Only the ids in these punches; the intern table holds every id ever seen
+                    present = [logs.user_ids[code] for code in np.unique(logs.user_codes)]
+                    self._sync_users(conn, present)
+                except Exception as e:
+                    logger.warning(f"Error refreshing users: {e}")
+                self.clock.maybe_resync(conn, self.device_serial)
+        except Exception:
+            DEVICE_ERRORS.inc(device=device)
+            raise
+        RECORDS_FETCHED.inc(len(logs), device=device)
+        return logs
+
+    def _sample_clock(self, conn):
+        try:
+            self.clock.sample(conn, self.device_serial)
         except Exception as e:
-            self.last_api_status = f"Error: {e}"
-            print(f"Error sending log: {e}")
+            logger.warning(f"Could not read the device clock: {e}")
+
+    def normalize(self, logs):
+        # Device punches as a PunchStore with clock corrections applied; done as
+        # soon as they are read so a later resync cannot change their correction
+        if not isinstance(logs, PunchStore):
+            logs = PunchStore.from_logs(logs)
+        return self.clock.normalize(self.device_serial, logs)
+
+    def _ingest(self, logs):
+        # Every punch goes to the report cache; service-day punches are queued for upload
+        if not isinstance(logs, PunchStore):
+            logs = PunchStore.from_logs(logs)
+        if self.cache.add(self.device_serial, logs):
+            self.rollups.refresh()
+        return self._queue_logs(logs)
+
+    def _queue_logs(self, logs):
+        # Queue every new service-day punch in one transaction, filtering the
+        # store's columns instead of looping over records
+        serial = self.device_serial
+        read_from = self.outbox.read_checkpoint(serial) or self._load_last_sync()
+        if not isinstance(logs, PunchStore):
+            logs = PunchStore.from_logs(logs)
+
+        timestamps = logs.timestamps
+        dedup = self.outbox.dedup
+        baseline = self._ack_baseline(dedup) if dedup is not None else None
+        if dedup is not None and baseline is not None:
+            # Punches up to the checkpoint kept before the index existed were
+            # uploaded then; only later ones are checked against the index
+            fresh = timestamps >= to_epoch(baseline)
+        elif dedup is not None or read_from is None:
+            # The ack index decides what is new, so punches behind the checkpoint
+            # (device clock moved back, checkpoint lost) are still uploaded
+            fresh = np.ones(len(timestamps), dtype=bool)
+        else:
+            # >= so punches sharing the checkpoint second are not lost; the
+            # outbox key makes re-queueing them a no-op
+            fresh = timestamps >= to_epoch(read_from)
+        last_read = read_from
+        if fresh.any():
+            newest = from_epoch(timestamps[fresh].max())
+            if last_read is None or newest > last_read:
+                last_read = newest
+
+        weekdays = logs.weekdays()
+        allowed = np.isin(weekdays, list(self.schedule.service_days))
+        new_logs = logs.take(fresh & allowed)
+        skipped = np.bincount(weekdays[fresh & ~allowed], minlength=7)
+        if skipped.any():
+            logger.debug(f"Skipping {int(skipped.sum())} logs outside the sync days")
+
+        queued = self.outbox.enqueue(serial, new_logs, last_read=last_read)
+        if queued:
+            logger.info(f"Queued {queued} new logs")
+        self._count_new(np.bincount(weekdays[fresh & allowed], minlength=7), skipped)
+        self._update_lag(last_read)
+        return queued
+
+    def _ack_baseline(self, dedup):
+        # The acknowledged checkpoint this device had when the index first saw
+        # it, e.g. last_sync.txt from before upgrading
+        serial = self.device_serial
+        if dedup.has_baseline(serial):
+            return dedup.baseline(serial)
+        return dedup.set_baseline(serial, self._load_last_sync() or self.outbox.acked_through(serial))
+
+    def _count_new(self, queued, skipped):
+        # Per-weekday counts, indexed by Python weekday
+        device = self.metrics_label
+        for day in range(7):
+            if queued[day]:
+                RECORDS_NEW.inc(int(queued[day]), device=device, weekday=calendar.day_name[day])
+            if skipped[day]:
+                RECORDS_SKIPPED.inc(int(skipped[day]), device=device, weekday=calendar.day_name[day])
+
+    def _update_lag(self, last_read=None):
+        # Seconds between the newest punch read and the acknowledged watermark
+        if last_read is None:
+            last_read = self.outbox.read_checkpoint(self.device_serial)
+        if last_read is None:
+            return
+        acked = self.last_sync_time or self._load_last_sync() or last_read
+        CHECKPOINT_LAG.set(max(0.0, (last_read - acked).total_seconds()), device=self.metrics_label)
+
+    def _on_live_events(self, events):
+        logger.info(f"Captured {len(events)} realtime punches")
+        if self._ingest(self.normalize(events)):
+            self._drain_outbox()
+            self._update_checkpoint()
+
+    def _drain_outbox(self):
+        # Upload queued records oldest first until the outbox has nothing due
+        sent = self.outbox.drain(self.sender, self.drain_batch_size, lambda: self.sync_running)
+        self.last_api_status = self.sender.last_status
+        return sent
+
+    def _update_checkpoint(self):
+        acked = self.outbox.acked_through(self.device_serial)
+        if acked and acked != self.last_sync_time:
+            self._save_last_sync(acked)
+            logger.info(f"Updated last sync time → {acked}")
+        if acked:
+            self.last_sync_time = acked
+        self._update_lag()
+
+    def wake(self):
+        # Poll and upload now instead of waiting out the schedule
+        self._wake.set()
+
+    def _next_delay(self):
+        # Sleep until the schedule's next poll, or sooner if failed uploads
+        # become due for retry before then
+        delay = self.schedule.next_delay()
+        retry = self.outbox.next_retry()
+        if retry is not None:
+            delay = min(delay, max(1.0, retry))
+        return delay
 
     def _sync_loop(self):
-        print("Starting background sync loop...")
-        last_sync = self._load_last_sync()
-        new_last_sync = last_sync
-
-        # Allowed days: Sunday(6), Monday(0), Wednesday(2), Friday(4)
-        ALLOWED_DAYS = {6, 0, 2, 4}
+        logger.info("Starting background sync loop...")
+        recovered = self.outbox.recover()
+        if recovered:
+            logger.info(f"Recovered {recovered} in-flight logs from outbox")
+        self.last_sync_time = self._load_last_sync()
 
         while self.sync_running:
             try:
-                if not self.conn:
-                    print("Not connected, skipping sync cycle...")
-                    time_module.sleep(self.poll_interval)
-                    continue
-
-                logs = self.conn.get_attendance()
-                logs.sort(key=lambda x: x.timestamp)
-
-                for log in logs:
-                    log_day = log.timestamp.weekday()
-                    if log_day in ALLOWED_DAYS:
-                        if last_sync is None or log.timestamp > last_sync:
-                            self._send_log(log.user_id, log.timestamp)
-                            if new_last_sync is None or log.timestamp > new_last_sync:
-                                new_last_sync = log.timestamp
-                    else:
-                        print(f"Skipping log for {log.timestamp.strftime('%A')} ({log.timestamp})")
-
-                if new_last_sync:
-                    self._save_last_sync(new_last_sync)
-                    self.last_sync_time = new_last_sync
-                    print(f"Updated last sync time → {new_last_sync}")
+                # The connection supervisor reconnects in the background; queued
+                # records still upload while the device is unreachable
+                if self.conn:
+                    self._poll_device()
+                else:
+                    logger.warning("Not connected, skipping device poll...")
+                self._drain_outbox()
+                self._update_checkpoint()
+
+                # Between polls, stream punches as they happen when the firmware
+                # allows it; each batch is uploaded as soon as it arrives
+                if self.live_capture and self.conn:
+                    with self.connection.session() as conn:
+                        captured = self.fetcher.capture(
+                            conn, self._on_live_events, self._next_delay(),
+                            lambda: (not self.sync_running or self._wake.is_set()
+                                     or self.connection.waiters > 0))
+                    if captured:
+                        self._wake.clear()
+                        continue
 
             except Exception as e:
-                print(f"Sync error: {e}")
+                logger.error(f"Sync error: {e}")
 
-            time_module.sleep(self.poll_interval)
+            self._wake.wait(self._next_delay())
+            self._wake.clear()
+
+    def reconcile(self, start_date, end_date):
+        # Mark everything the API already holds in the range as acknowledged,
+        # in one listing instead of one upload per record. Returns the number
+        # of fingerprints added, or None if the API cannot list records.
+        known = self.sender.fetch_known(start_date, end_date)
+        if known is None or self.dedup is None:
+            return None
+        added = self.dedup.add(np.fromiter((fingerprint(u, ts) for u, ts in known),
+                                           dtype=np.int64, count=len(known)))
+        logger.info(f"Reconciled {len(known)} records from the API, {added} were new to the index")
+        return added
 
     def get_sync_status(self):
         return {
             "last_sync_time": self.last_sync_time,
-            "last_api_status": self.last_api_status
+            "last_api_status": self.last_api_status,
+            "outbox_depth": self.outbox.depth(),
+            "outbox_failed": self.outbox.failed(),
+            "clock_skew": self.clock.skew,
         }
 
 # ------------------ MAIN TEST ------------------
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     device_ip = "192.168.1.201"  # Replace with your device's IP address
     attendance_system = ZKTecoAttendance(device_ip)
     try:
@@ -0,0 +1,106 @@
+# Compares the columnar get_attendance grouping against the original
+# iterrows() state machine on synthetic punches and checks both agree.
+#
+#   python benchmarks/bench_grouping.py --sizes 10000 100000 1000000
+
+import argparse
+import os
+import random
+import sys
+import time as time_module
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from attendance_system import attendance_frame, group_attendance  # noqa: E402
+
+
+def make_attendance(n, members=300, seed=1):
+    # Check-in / check-out pairs spread over service days, with some stray
+    # repeats and missing check-outs
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 7, 8, 0)
+    logs = []
+    while len(logs) < n:
+        day = start + timedelta(days=rng.randrange(0, 730))
+        user_id = str(rng.randrange(1, members + 1))
+        check_in = day + timedelta(minutes=rng.randrange(0, 120), seconds=rng.randrange(60))
+        logs.append(SimpleNamespace(user_id=user_id, timestamp=check_in, status=1, punch=0))
+        if rng.random() < 0.85:
+            check_out = check_in + timedelta(minutes=rng.randrange(30, 240))
+            logs.append(SimpleNamespace(user_id=user_id, timestamp=check_out, status=1, punch=1))
+    return logs[:n]
+
+
+def legacy_group(attendance, users):
+    raw_records = []
+    for att in attendance:
+        raw_records.append({
+            'user_id': att.user_id,
+            'user_name': users.get(str(att.user_id), "Unknown"),
+            'timestamp': att.timestamp,
+            'raw_status': att.status,
+            'punch': att.punch,
+        })
+    df = pd.DataFrame(raw_records).sort_values(['user_id', 'timestamp'])
+
+    grouped_records = []
+    current_user = current_date = current_user_name = None
+    check_in = check_out = None
+    for _, row in df.iterrows():
+        date = row['timestamp'].date()
+        if current_user != row['user_id'] or current_date != date:
+            if current_user is not None and check_in is not None:
+                grouped_records.append({'user_id': current_user, 'user_name': current_user_name,
+                                        'date': current_date, 'check_in': check_in,
+                                        'check_out': check_out})
+            current_user, current_user_name, current_date = row['user_id'], row['user_name'], date
+            check_in = check_out = None
+        if row['punch'] == 0:
+            check_in = row['timestamp']
+        elif row['punch'] == 1:
+            check_out = row['timestamp']
+    if current_user is not None and check_in is not None:
+        grouped_records.append({'user_id': current_user, 'user_name': current_user_name,
+                                'date': current_date, 'check_in': check_in, 'check_out': check_out})
+
+    result_df = pd.DataFrame(grouped_records)
+    if not result_df.empty:
+        result_df['duration'] = result_df.apply(
+            lambda row: (row['check_out'] - row['check_in']).total_seconds() / 3600
+            if pd.notnull(row['check_out']) else None,
+            axis=1
+        )
+    return result_df
+
+
+def timed(fn, *args):
+    started = time_module.perf_counter()
+    result = fn(*args)
+    return result, time_module.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_attendance grouping benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=1_000_000,
+                        help="skip the slow legacy run above this many punches")
+    args = parser.parse_args()
+
+    users = {str(i): f"Member {i}" for i in range(1, 301)}
+    print(f"{'punches':>10} {'legacy s':>10} {'columnar s':>11} {'speedup':>8}")
+    for n in args.sizes:
+        attendance = make_attendance(n)
+        new, new_s = timed(lambda: group_attendance(attendance_frame(attendance), users))
+        if n > args.skip_legacy_above:
+            print(f"{n:>10} {'-':>10} {new_s:>11.3f} {'-':>8}")
+            continue
+        old, old_s = timed(legacy_group, attendance, users)
+        pd.testing.assert_frame_equal(old, new)
+        print(f"{n:>10} {old_s:>10.3f} {new_s:>11.3f} {old_s / new_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Local stand-in for the attendance API with injectable latency and error
+# rates. Accepts the single-record JSON object and the batched JSON array
+# that LogSender posts, and answers arrays with per-record results.
+#
+#   with FakeAttendanceAPI(latency=0.02, error_rate=0.05) as api:
+#       sender = LogSender(api.url, "bench-key")
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time as time_module
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body if body is not None else {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # Known records in [from, to], for reconcile
+        api = self.server.api
+        query = parse_qs(urlparse(self.path).query)
+        status, reply = api.known(self.headers.get("x-api-key"), query.get("from", [None])[0],
+                                  query.get("to", [None])[0])
+        self._reply(status, reply)
+
+    def do_POST(self):
+        api = self.server.api
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, reply = api.handle(self.headers.get("x-api-key"), body)
+        self._reply(status, reply)
+
+
+class FakeAttendanceAPI:
+    def __init__(self, latency=0.0, error_rate=0.0, record_error_rate=0.0, batch=True,
+                 api_key=None, port=0, seed=1):
+        # latency: seconds added to every request
+        # error_rate: fraction of requests answered with HTTP 500
+        # record_error_rate: fraction of records in an accepted batch reported as failed
+        # batch: False answers JSON arrays with 400, like the original endpoint
+        self.latency = latency
+        self.error_rate = error_rate
+        self.record_error_rate = record_error_rate
+        self.batch = batch
+        self.api_key = api_key
+        self.port = port
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.received = 0
+        self.accepted = set()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/attendance/device"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-api").start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _roll(self, rate):
+        with self._lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def handle(self, api_key, body):
+        if self.latency:
+            time_module.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+        if self.api_key is not None and api_key != self.api_key:
+            return 401, {"error": "invalid api key"}
+        if self._roll(self.error_rate):
+            with self._lock:
+                self.errors += 1
+            return 500, {"error": "injected failure"}
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {"error": "invalid json"}
+
+        if isinstance(payload, dict):
+            return self._accept(payload)
+        if not isinstance(payload, list) or not self.batch:
+            return 400, {"error": "expected a single attendance object"}
+        results = []
+        for record in payload:
+            if self._roll(self.record_error_rate):
+                results.append({"status": "error", "error": "injected failure"})
+            else:
+                status, body = self._accept(record)
+                results.append(body if status >= 400 else
+                               {"status": "duplicate" if status == 409 else "created"})
+        return 200, {"results": results}
+
+    def known(self, api_key, start, end):
+        if self.api_key is not None and api_key != self.api_key:
+            return 401, {"error": "invalid api key"}
+        with self._lock:
+            records = [{"user_id": user_id, "timestamp": timestamp}
+                       for user_id, timestamp in self.accepted
+                       if (start is None or timestamp >= start) and (end is None or timestamp <= end)]
+        return 200, {"records": records}
+
+    def _accept(self, record):
+        key = (record.get("user_id"), record.get("timestamp"))
+        with self._lock:
+            self.received += 1
+            if key in self.accepted:
+                return 409, {"status": "duplicate"}
+            self.accepted.add(key)
+        return 201, {"status": "created"}
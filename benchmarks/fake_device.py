@@ -0,0 +1,199 @@
+# In-process stand-in for a pyzk device: synthetic users and attendance logs
+# served through the same calls ZKTecoAttendance makes on a real MB460.
+#
+#   fake = FakeZK(users=make_users(300), records=make_punches(100_000))
+#   use_fake_device(system, fake)
+#   system.connect()
+
+import random
+import threading
+import time as time_module
+from datetime import datetime, timedelta, timezone
+
+
+class FakeUser:
+    __slots__ = ("uid", "user_id", "name", "privilege", "password", "group_id", "card")
+
+    def __init__(self, uid, user_id, name):
+        self.uid = uid
+        self.user_id = user_id
+        self.name = name
+        self.privilege = 0
+        self.password = ""
+        self.group_id = ""
+        self.card = 0
+
+
+class FakeAttendance:
+    __slots__ = ("uid", "user_id", "timestamp", "status", "punch")
+
+    def __init__(self, user_id, timestamp, punch, status=1, uid=0):
+        self.uid = uid
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+
+    def __repr__(self):
+        return f"<Attendance>: {self.user_id} : {self.timestamp} ({self.status}, {self.punch})"
+
+
+def make_users(count=300):
+    return [FakeUser(uid, str(uid), f"Member {uid}") for uid in range(1, count + 1)]
+
+
+# Timezone the simulated device clock is set to, like the MB460 on Lagos time
+DEVICE_TZ = timezone(timedelta(hours=1))
+
+# Punch patterns:
+#   pairs    check-in then (usually) a check-out on the same day
+#   in_only  check-ins only, as on devices set to a single state
+#   random   punch state picked at random, with stray repeats
+PATTERNS = ("pairs", "in_only", "random")
+
+
+def make_punches(count, users=None, pattern="pairs", start=datetime(2024, 1, 7, 8, 0),
+                 days=730, service_days_only=False, seed=1):
+    # Synthetic attendance log in device order (oldest first)
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown punch pattern {pattern!r}, expected one of {PATTERNS}")
+    rng = random.Random(seed)
+    user_ids = [u.user_id for u in users] if users else [str(i) for i in range(1, 301)]
+    day_offsets = range(days)
+    if service_days_only:
+        day_offsets = [d for d in day_offsets if (start + timedelta(days=d)).weekday() in (6, 0, 2, 4)]
+
+    logs = []
+    while len(logs) < count:
+        day = start + timedelta(days=rng.choice(day_offsets))
+        user_id = rng.choice(user_ids)
+        check_in = day + timedelta(minutes=rng.randrange(0, 120), seconds=rng.randrange(60))
+        if pattern == "random":
+            logs.append(FakeAttendance(user_id, check_in, rng.choice((0, 1))))
+            continue
+        logs.append(FakeAttendance(user_id, check_in, 0))
+        if pattern == "pairs" and rng.random() < 0.85:
+            logs.append(FakeAttendance(user_id, check_in + timedelta(minutes=rng.randrange(30, 240)), 1))
+    logs = logs[:count]
+    logs.sort(key=lambda log: log.timestamp)
+    return logs
+
+
+class FakeConnection:
+    # The subset of zk.base.ZK a connected session exposes
+    def __init__(self, device):
+        self.device = device
+        self.records = 0
+        self.users = 0
+        self.end_live_capture = False
+        self.is_connect = True
+
+    def _command(self, records=0):
+        device = self.device
+        if not self.is_connect:
+            raise OSError("fake device: socket closed")
+        delay = device.latency
+        if records and device.records_per_second:
+            delay += records / device.records_per_second
+        if delay:
+            time_module.sleep(delay)
+        device.commands += 1
+
+    def read_sizes(self):
+        self._command()
+        with self.device.lock:
+            self.records = len(self.device.records)
+            self.users = len(self.device.users)
+        return True
+
+    def get_attendance(self):
+        with self.device.lock:
+            logs = list(self.device.records)
+        self._command(len(logs))
+        return logs
+
+    def get_users(self):
+        with self.device.lock:
+            users = list(self.device.users)
+        self._command(len(users))
+        return users
+
+    def get_serialnumber(self):
+        self._command()
+        return self.device.serial
+
+    def get_time(self):
+        self._command()
+        return self.device.now()
+
+    def set_time(self, timestamp):
+        self._command()
+        self.device.clock_offset = timestamp - self.device.now() + self.device.clock_offset
+        return True
+
+    def live_capture(self, new_timeout=10):
+        # Yields queued punches as they arrive and None on every timeout,
+        # until end_live_capture is set
+        self.end_live_capture = False
+        device = self.device
+        while not self.end_live_capture:
+            if device.live_events.wait(new_timeout):
+                with device.lock:
+                    events, device.pending = device.pending, []
+                    device.live_events.clear()
+                for event in events:
+                    yield event
+            else:
+                yield None
+        self.end_live_capture = False
+
+    def disconnect(self):
+        self.is_connect = False
+        return True
+
+
+class FakeZK:
+    # Drop-in for zk.ZK; every connect() shares the same simulated device state
+    def __init__(self, ip="127.0.0.1", port=4370, timeout=5, password=0, users=None, records=None,
+                 serial="FAKE0000001", latency=0.0, records_per_second=0):
+        self.ip = ip
+        self.port = port
+        self.users = users if users is not None else make_users()
+        self.records = records if records is not None else []
+        self.serial = serial
+        # Per-command round trip and attendance/user transfer speed, in seconds
+        # and records per second (0 = instant)
+        self.latency = latency
+        self.records_per_second = records_per_second
+        self.clock_offset = timedelta(0)
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.pending = []
+        self.live_events = threading.Event()
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def now(self):
+        # Device wall clock: local time in DEVICE_TZ plus any injected drift
+        return datetime.now(DEVICE_TZ).replace(tzinfo=None) + self.clock_offset
+
+    def punch(self, user_id, timestamp=None, punch=0):
+        # Record a new punch, visible to both polling and live capture
+        log = FakeAttendance(str(user_id), timestamp or self.now().replace(microsecond=0), punch)
+        with self.lock:
+            self.records.append(log)
+            self.pending.append(log)
+        self.live_events.set()
+        return log
+
+    def extend(self, logs):
+        with self.lock:
+            self.records.extend(logs)
+
+
+def use_fake_device(system, fake):
+    # Point a ZKTecoAttendance (before connect()) at a FakeZK
+    system.connection.zk = fake
+    system.zk = fake
+    return system
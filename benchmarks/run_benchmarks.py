@@ -0,0 +1,311 @@
+# Benchmark suite against a simulated device and a local fake API, so no
+# MB460 or live endpoint is needed. Results are written as JSON; pass an
+# earlier results file to --compare to see regressions between versions.
+#
+#   python benchmarks/run_benchmarks.py --sizes 1000 100000 1000000 --output results.json
+#   python benchmarks/run_benchmarks.py --only grouping sync --compare results.json
+#
+# The table benchmark needs PyQt5 and renders offscreen.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time as time_module
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeAttendanceAPI  # noqa: E402
+from fake_device import FakeZK, make_punches, make_users, use_fake_device  # noqa: E402
+from attendance_system import ALLOWED_DAYS, ZKTecoAttendance  # noqa: E402
+from async_engine import AsyncZKTecoAttendance  # noqa: E402
+from sync_outbox import Outbox  # noqa: E402
+from sync_dedup import AckIndex  # noqa: E402
+
+BENCHMARKS = ("grouping", "sync", "upgrade", "table")
+
+
+def timed(fn, *args, **kwargs):
+    started = time_module.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time_module.perf_counter() - started
+
+
+ENGINES = {"thread": ZKTecoAttendance, "async": AsyncZKTecoAttendance}
+
+
+def make_system(workdir, fake, api=None, engine="thread", **kwargs):
+    db_path = os.path.join(workdir, "attendance.db")
+    system = ENGINES[engine](
+        "127.0.0.1", api_url=api.url if api else "http://127.0.0.1:9/unused", api_key="bench-key",
+        batch_url=api.url if api else None,
+        db_path=db_path, last_sync_file=os.path.join(workdir, "last_sync.txt"),
+        keepalive_interval=3600, **kwargs)
+    return use_fake_device(system, fake)
+
+
+# ------------------ GROUPING ------------------
+def bench_grouping(size, args):
+    # Device read into the punch cache, then get_attendance over the whole range
+    users = make_users(args.users)
+    fake = FakeZK(users=users, records=make_punches(size, users, pattern=args.pattern))
+    with tempfile.TemporaryDirectory() as workdir:
+        system = make_system(workdir, fake, auto_sync=False)
+        system.connect()
+        try:
+            _, refresh_s = timed(system.refresh_from_device)
+            grouped, group_s = timed(system.get_attendance)
+        finally:
+            system.disconnect()
+            system.outbox.close()
+            system.cache.close()
+    return {
+        "seconds": group_s,
+        "refresh_seconds": refresh_s,
+        "rows": len(grouped),
+    }
+
+
+# ------------------ SYNC ------------------
+def bench_sync(size, args):
+    # Connect to a device holding `size` punches and time the background sync
+    # loop until every allowed-day punch is acknowledged by the API
+    users = make_users(args.users)
+    records = make_punches(size, users, pattern=args.pattern)
+    expected = sum(1 for log in records if log.timestamp.weekday() in ALLOWED_DAYS)
+    # The API keys records on user and timestamp, so same-second punches count once
+    unique = len({(log.user_id, log.timestamp) for log in records
+                  if log.timestamp.weekday() in ALLOWED_DAYS})
+    fake = FakeZK(users=users, records=records, latency=args.device_latency)
+
+    with tempfile.TemporaryDirectory() as workdir, \
+            FakeAttendanceAPI(latency=args.api_latency, error_rate=args.error_rate,
+                              record_error_rate=args.record_error_rate) as api:
+        # Short retry backoff so injected failures are retried within the run
+        db_path = os.path.join(workdir, "attendance.db")
+        outbox = Outbox(db_path, retry_base=0.05, retry_max=1, dedup=AckIndex(db_path))
+        system = make_system(workdir, fake, api, engine=args.engine, outbox=outbox,
+                             poll_interval=args.poll_interval,
+                             upload_concurrency=args.concurrency, batch_size=args.batch_size)
+        started = time_module.perf_counter()
+        system.connect()
+        deadline = started + args.sync_timeout
+        completed = False
+        try:
+            while time_module.perf_counter() < deadline:
+                if len(api.accepted) >= unique and outbox.depth() == 0:
+                    completed = True
+                    break
+                time_module.sleep(0.02)
+            elapsed = time_module.perf_counter() - started
+        finally:
+            system.disconnect()
+            outbox.close()
+            system.cache.close()
+
+        return {
+            "seconds": elapsed,
+            "completed": completed,
+            "queued": expected,
+            "records_per_second": expected / elapsed if elapsed else None,
+            "api_requests": api.requests,
+            "api_errors": api.errors,
+            "api_received": api.received,
+        }
+
+
+# ------------------ UPGRADE ------------------
+def bench_upgrade(size, args):
+    # First sync after upgrading an install that only kept last_sync.txt: the
+    # ack index is new, and punches up to the checkpoint must not be uploaded
+    # again. Only punches sharing the checkpoint second may be resent.
+    users = make_users(args.users)
+    records = make_punches(size, users, pattern=args.pattern)
+    newest = max(log.timestamp for log in records)
+    allowed = ALLOWED_DAYS if newest.weekday() in ALLOWED_DAYS else set()
+    resendable = sum(1 for log in records if log.timestamp == newest and allowed)
+    fake = FakeZK(users=users, records=records, latency=args.device_latency)
+
+    with tempfile.TemporaryDirectory() as workdir, FakeAttendanceAPI(latency=args.api_latency) as api:
+        with open(os.path.join(workdir, "last_sync.txt"), "w") as f:
+            f.write(newest.isoformat())
+        db_path = os.path.join(workdir, "attendance.db")
+        outbox = Outbox(db_path, dedup=AckIndex(db_path))
+        system = make_system(workdir, fake, api, engine=args.engine, outbox=outbox,
+                             poll_interval=args.poll_interval)
+        started = time_module.perf_counter()
+        system.connect()
+        deadline = started + args.sync_timeout
+        try:
+            # The first poll has been queued once the read checkpoint exists
+            while time_module.perf_counter() < deadline:
+                if system.device_serial and outbox.read_checkpoint(system.device_serial) \
+                        and outbox.depth() == 0:
+                    break
+                time_module.sleep(0.02)
+            elapsed = time_module.perf_counter() - started
+        finally:
+            system.disconnect()
+            outbox.close()
+            system.cache.close()
+
+        return {
+            "seconds": elapsed,
+            "completed": api.received <= resendable,
+            "resent": api.received,
+            "resendable": resendable,
+        }
+
+
+# ------------------ TABLE ------------------
+def make_grouped_frame(rows, users=300, seed=1):
+    # Grouped attendance rows shaped like get_attendance() output
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, users + 1, rows)
+    days = pd.Timestamp("2024-01-07") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D")
+    check_in = days + pd.to_timedelta(8 * 3600 + rng.integers(0, 7200, rows), unit="s")
+    check_out = pd.Series(check_in + pd.to_timedelta(rng.integers(1800, 14400, rows), unit="s"))
+    check_out[rng.random(rows) > 0.85] = pd.NaT
+    frame = pd.DataFrame({
+        "user_id": user_ids.astype(str),
+        "user_name": [f"Member {u}" for u in user_ids],
+        "date": days.date,
+        "check_in": check_in,
+        "check_out": check_out,
+    })
+    frame["duration"] = (frame["check_out"] - frame["check_in"]).dt.total_seconds() / 3600
+    return frame
+
+
+def bench_table(size, args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtCore import Qt
+        from PyQt5.QtWidgets import QApplication
+        from attendance_gui import AttendanceWindow
+    except ImportError as e:
+        return {"skipped": f"PyQt5 not available: {e}"}
+
+    app = QApplication.instance() or QApplication([])
+    window = AttendanceWindow()
+    window.metrics_timer.stop()
+    window.show()
+    frame = make_grouped_frame(size, args.users)
+    app.processEvents()
+
+    def populate():
+        window.populate_table(frame)
+        window.table.viewport().repaint()
+        app.processEvents()
+
+    def sort_by_name():
+        window.table.sortByColumn(1, Qt.AscendingOrder)
+        app.processEvents()
+
+    def filter_text():
+        window.filter_edit.setText("Member 1")
+        app.processEvents()
+
+    try:
+        _, populate_s = timed(populate)
+        _, sort_s = timed(sort_by_name)
+        _, filter_s = timed(filter_text)
+    finally:
+        window.close()
+    return {"seconds": populate_s, "sort_seconds": sort_s, "filter_seconds": filter_s}
+
+
+RUNNERS = {"grouping": bench_grouping, "sync": bench_sync, "upgrade": bench_upgrade, "table": bench_table}
+
+
+# ------------------ RESULTS ------------------
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        import pandas as pd
+        pandas_version = pd.__version__
+    except ImportError:
+        pandas_version = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pandas_version,
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["benchmark"], r["size"]): r for r in baseline.get("results", [])}
+    print(f"\nCompared with {baseline_path} ({baseline.get('environment', {}).get('commit')})")
+    print(f"{'benchmark':>10} {'size':>10} {'before s':>10} {'after s':>10} {'change':>8}")
+    for r in results:
+        old = previous.get((r["benchmark"], r["size"]))
+        if not old or "seconds" not in old or "seconds" not in r:
+            continue
+        change = (r["seconds"] - old["seconds"]) / old["seconds"] * 100 if old["seconds"] else 0
+        print(f"{r['benchmark']:>10} {r['size']:>10} {old['seconds']:>10.3f} "
+              f"{r['seconds']:>10.3f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance sync benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--pattern", default="pairs", choices=("pairs", "in_only", "random"))
+    parser.add_argument("--device-latency", type=float, default=0.0, help="seconds per device command")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds per API request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API requests failing")
+    parser.add_argument("--record-error-rate", type=float, default=0.0,
+                        help="fraction of records in a batch reported as failed")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--engine", default="thread", choices=sorted(ENGINES),
+                        help="sync engine for the sync benchmark")
+    parser.add_argument("--sync-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # attendance_system imports pandas lazily; keep that out of the first timing
+    import pandas  # noqa: F401
+    results = []
+    print(f"{'benchmark':>10} {'size':>10} {'seconds':>10}  details")
+    for name in args.only:
+        for size in args.sizes:
+            result = {"benchmark": name, "size": size, **RUNNERS[name](size, args)}
+            results.append(result)
+            details = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                                for k, v in result.items() if k not in ("benchmark", "size", "seconds"))
+            seconds = f"{result['seconds']:.3f}" if "seconds" in result else "-"
+            print(f"{name:>10} {size:>10} {seconds:>10}  {details}")
+
+    report = {"environment": environment(), "options": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+from datetime import datetime, timezone
+import logging
+import sqlite3
+import threading
+import numpy as np
+
+from sync_sender import LAGOS_TZ
+from punch_store import to_epoch, from_epoch
+from sync_metrics import CLOCK_SKEW, CLOCK_ANOMALIES
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clock_corrections (
+    device_serial TEXT NOT NULL,
+    since INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (device_serial, since)
+) WITHOUT ROWID;
+"""
+
+
+class DeviceClock:
+    # Tracks how far a device's wall clock is from the host's and corrects
+    # punch timestamps for it.
+    #
+    # Every connect and poll reads the device time and folds the measured
+    # skew into an exponentially weighted average. Once the average is off by
+    # more than `tolerance` seconds a correction is recorded, starting at the
+    # device time it was measured at. Punches are shifted by the correction in
+    # force when they were recorded, so a refetch after a restart corrects them
+    # exactly as before and the outbox and ack index keys stay stable.
+    def __init__(self, path="attendance.db", tz=LAGOS_TZ, alpha=0.3, tolerance=60,
+                 max_skew=900, jump=300, resync=False):
+        # tz: timezone the device clock is set to
+        # tolerance: skew ignored as noise, and the step between recorded corrections
+        # max_skew: skew flagged as an anomaly on every sample
+        # jump: change between two samples treated as the clock being set
+        # resync: set the device clock from the host once skew passes tolerance
+        self.tz = tz
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.max_skew = max_skew
+        self.jump = jump
+        self.resync = resync
+        self.skew = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # device_serial → (since, offset) arrays, ordered by since
+        self._corrections = {}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ------------------ CORRECTIONS ------------------
+    def corrections(self, device_serial):
+        with self._lock:
+            cached = self._corrections.get(device_serial)
+            if cached is None:
+                rows = self._db.execute(
+                    "SELECT since, offset FROM clock_corrections WHERE device_serial = ? ORDER BY since",
+                    (device_serial,)).fetchall()
+                cached = (np.array([r[0] for r in rows], dtype=np.int64),
+                          np.array([r[1] for r in rows], dtype=np.int64))
+                self._corrections[device_serial] = cached
+        return cached
+
+    def current(self, device_serial):
+        # Correction in force now, in seconds to subtract from device time
+        _, offsets = self.corrections(device_serial)
+        return int(offsets[-1]) if len(offsets) else 0
+
+    def _record(self, device_serial, since, offset, supersede=False):
+        # supersede drops corrections starting at or after since, which a clock
+        # set back behind them would otherwise leave in force
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if supersede:
+                    self._db.execute("DELETE FROM clock_corrections WHERE device_serial = ? AND since >= ?",
+                                     (device_serial, since))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO clock_corrections (device_serial, since, offset) VALUES (?, ?, ?)",
+                    (device_serial, since, offset))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._corrections.pop(device_serial, None)
+        logger.info(f"Clock correction for {device_serial} from {from_epoch(since)}: "
+                    f"{offset:+d}s")
+
+    # ------------------ SAMPLING ------------------
+    def _now(self):
+        # Host wall clock in the device's timezone
+        return datetime.now(self.tz)
+
+    def sample(self, conn, device_serial):
+        # Read the device clock and update the skew estimate; returns the raw skew
+        before = datetime.now(timezone.utc)
+        device_time = conn.get_time()
+        after = datetime.now(timezone.utc)
+        host = before + (after - before) / 2
+        skew = (device_time.replace(tzinfo=self.tz) - host).total_seconds()
+
+        if self.skew is not None and abs(skew - self.skew) > self.jump:
+            # A step, not drift: someone set the clock, or it reset
+            self._flag(device_serial, "jump", f"device clock jumped {skew - self.skew:+.0f}s")
+            self.skew = skew
+        elif self.skew is None:
+            self.skew = skew
+        else:
+            self.skew += self.alpha * (skew - self.skew)
+        CLOCK_SKEW.set(self.skew, device=device_serial)
+        if abs(self.skew) > self.max_skew:
+            self._flag(device_serial, "skew", f"device clock is {self.skew:+.0f}s off")
+
+        # Record a new correction when the estimate moved a full tolerance step
+        offset = round(self.skew) if abs(self.skew) >= self.tolerance else 0
+        if abs(offset - self.current(device_serial)) >= self.tolerance:
+            self._record(device_serial, to_epoch(device_time), offset)
+        return skew
+
+    def maybe_resync(self, conn, device_serial):
+        # Set the device clock from the host when resync is on and the skew is
+        # past tolerance. Call only after the punches read so far have been
+        # normalized: a fast clock set back re-covers device times that were
+        # already corrected, and from here on those times mean host time.
+        if not self.resync or self.skew is None or abs(self.skew) < self.tolerance:
+            return False
+        try:
+            conn.set_time(self._now().replace(tzinfo=None))
+        except Exception as e:
+            logger.warning(f"Could not set the clock on {device_serial}: {e}")
+            return False
+        logger.info(f"Set the clock on {device_serial} ({self.skew:+.0f}s off) from the host")
+        # Punches from here on carry the host's time
+        self._record(device_serial, to_epoch(self._now()), 0, supersede=True)
+        self.skew = 0.0
+        CLOCK_SKEW.set(0.0, device=device_serial)
+        return True
+
+    def _flag(self, device_serial, kind, message):
+        CLOCK_ANOMALIES.inc(device=device_serial, kind=kind)
+        logger.warning(f"Clock anomaly on {device_serial}: {message}")
+
+    # ------------------ NORMALIZATION ------------------
+    def offsets(self, device_serial, timestamps):
+        # Per-row correction for device epoch timestamps, in one searchsorted pass
+        since, offsets = self.corrections(device_serial)
+        if not len(since):
+            return np.zeros(len(timestamps), dtype=np.int64)
+        index = np.searchsorted(since, timestamps, side="right") - 1
+        return np.where(index >= 0, offsets[np.maximum(index, 0)], 0)
+
+    def normalize(self, device_serial, logs):
+        # Corrected copy of a PunchStore (the same store if nothing needs
+        # correcting). Punches later than the host clock are flagged.
+        if not len(logs):
+            return logs
+        shift = self.offsets(device_serial, logs.timestamps)
+        corrected = logs.shifted(-shift) if shift.any() else logs
+        future = int(np.count_nonzero(
+            corrected.timestamps > to_epoch(self._now()) + self.tolerance))
+        if future:
+            self._flag(device_serial, "future", f"{future} punches stamped after the host clock")
+        return corrected
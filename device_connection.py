@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+import logging
+import random
+import threading
+from zk import ZK
+from zk.exception import ZKErrorConnection, ZKNetworkError
+
+logger = logging.getLogger(__name__)
+
+
+# Errors that mean the socket itself is gone, not just that one command failed
+DEAD_SOCKET_ERRORS = (OSError, ZKNetworkError, ZKErrorConnection)
+
+
+class DeviceConnection:
+    # Owns the one ZK session for a device. Callers borrow it through
+    # session(); a supervisor thread probes it while idle and reconnects with
+    # exponential backoff and jitter when it drops.
+    def __init__(self, ip_address, port=4370, timeout=5, password=0,
+                 keepalive_interval=15, backoff_base=1, backoff_max=60, on_reconnect=None):
+        self.ip_address = ip_address
+        self.zk = ZK(ip_address, port=port, timeout=timeout, password=password)
+        self.conn = None
+        self.keepalive_interval = keepalive_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_reconnect = on_reconnect
+        self.failures = 0
+        self.last_error = None
+
+        self.lock = threading.RLock()
+        self._waiters_lock = threading.Lock()
+        self.waiters = 0
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._supervisor = None
+
+    @property
+    def is_open(self):
+        return self._supervisor is not None and self._supervisor.is_alive()
+
+    # ------------------ LIFECYCLE ------------------
+    def open(self):
+        # First connection is synchronous so callers see the failure
+        with self.access():
+            if self.conn is None:
+                self.conn = self.zk.connect()
+        self.failures = 0
+        self._closed.clear()
+        if not self.is_open:
+            self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+            self._supervisor.start()
+        return self.conn
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        if self._supervisor is not None and self._supervisor is not threading.current_thread():
+            self._supervisor.join()
+        self._supervisor = None
+        with self.access():
+            self._drop()
+
+    def _drop(self):
+        if self.conn is not None:
+            try:
+                self.conn.disconnect()
+            except Exception:
+                pass
+            self.conn = None
+
+    # ------------------ ACCESS ------------------
+    @contextmanager
+    def access(self):
+        # Exclusive use of the connection, which may be None while reconnecting.
+        # `waiters` lets a long holder (live capture) see that someone is queued.
+        with self._waiters_lock:
+            self.waiters += 1
+        try:
+            self.lock.acquire()
+        finally:
+            with self._waiters_lock:
+                self.waiters -= 1
+        try:
+            yield self.conn
+        finally:
+            self.lock.release()
+
+    @contextmanager
+    def session(self):
+        # A live connection or ConnectionError; a dead socket is dropped so the
+        # supervisor reconnects, any other device error triggers a probe.
+        with self.access() as conn:
+            if conn is None:
+                raise ConnectionError(f"Device at {self.ip_address} is not connected")
+            try:
+                yield conn
+            except DEAD_SOCKET_ERRORS as e:
+                self.mark_dead(e)
+                raise
+            except Exception:
+                self._wake.set()
+                raise
+
+    def mark_dead(self, error=None):
+        with self.access():
+            if self.conn is not None:
+                logger.error(f"Lost connection to {self.ip_address}: {error}")
+                self.last_error = str(error)
+                self._drop()
+        self._wake.set()
+
+    # ------------------ SUPERVISOR ------------------
+    def probe(self):
+        # Cheap keepalive: one CMD_GET_TIME round trip
+        with self.access() as conn:
+            if conn is None:
+                return False
+            try:
+                conn.get_time()
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Keepalive to {self.ip_address} failed: {e}")
+                self._drop()
+                return False
+
+    def _backoff(self):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** min(self.failures, 16))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _reconnect(self):
+        try:
+            with self.access():
+                if self.conn is None:
+                    self.conn = self.zk.connect()
+            logger.info(f"Reconnected to device at {self.ip_address}")
+            self.failures = 0
+            self.last_error = None
+            if self.on_reconnect:
+                self.on_reconnect()
+            return True
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.warning(f"Reconnect to {self.ip_address} failed ({self.failures}): {e}")
+            return False
+
+    def _supervise(self):
+        delay = self.keepalive_interval
+        while not self._closed.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._closed.is_set():
+                break
+            if self.conn is None:
+                delay = self.keepalive_interval if self._reconnect() else self._backoff()
+                continue
+            # Only probe an idle connection; a busy one is evidently alive
+            if self.lock.acquire(blocking=False):
+                try:
+                    if not self.probe():
+                        delay = 0
+                        continue
+                finally:
+                    self.lock.release()
+            delay = self.keepalive_interval
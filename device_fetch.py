@@ -0,0 +1,128 @@
+import threading
+import logging
+import time as time_module
+from punch_store import PunchStore
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalFetcher:
+    # Tracks the device's attendance record count so polls only download the
+    # log when it has grown, and only hand the new tail to the caller. Logs
+    # are returned as PunchStore views over one compact copy of the device log.
+    def __init__(self):
+        # Cached copy of the device log, shared by report fetches and sync polls
+        self.record_count = None
+        self.logs = PunchStore()
+        # How far into the log fetch_new() has already handed records out
+        self.delivered = None
+        self.delivered_last = None
+        self.live_supported = None
+        self._lock = threading.RLock()
+
+    def reset(self):
+        with self._lock:
+            self.record_count = None
+            self.logs = PunchStore()
+            self.delivered = None
+            self.delivered_last = None
+
+    def _device_count(self, conn):
+        # One small CMD_GET_FREE_SIZES round trip instead of the whole table
+        conn.read_sizes()
+        return conn.records
+
+    def _read(self, conn, count=None):
+        # Serve from the cache when the device still holds the same number of records
+        if count is not None and count == self.record_count:
+            return self.logs
+        # pyzk builds one Attendance object per record; they are only kept
+        # long enough to be packed into columns
+        logs = PunchStore.from_logs(conn.get_attendance() or [])
+        self.logs = logs
+        self.record_count = len(logs)
+        return logs
+
+    def _same_record(self, a, b):
+        return str(a.user_id) == str(b.user_id) and a.timestamp == b.timestamp and a.punch == b.punch
+
+    def _deliver(self, logs, start):
+        self.delivered = len(logs)
+        self.delivered_last = logs[-1] if len(logs) else None
+        return logs.view(start)
+
+    def fetch_all(self, conn, force=False):
+        # Full device log, served from memory while the record count is unchanged
+        with self._lock:
+            count = None if force else self._device_count(conn)
+            return self._read(conn, count).view()
+
+    def fetch_new(self, conn):
+        # Records added since the previous call; everything on the first call
+        # or after the device log was cleared or wrapped around.
+        with self._lock:
+            count = self._device_count(conn)
+            known = self.delivered
+            if known is None:
+                return self._deliver(self._read(conn, count), 0)
+            if count == known:
+                return []
+            if count < known:
+                logger.warning(f"Device record count dropped {known} → {count}, rescanning full log")
+                return self._deliver(self._read(conn, count), 0)
+
+            logs = self._read(conn, count)
+            if len(logs) < known or (self.delivered_last is not None
+                                     and not self._same_record(logs[known - 1], self.delivered_last)):
+                logger.warning("Device log no longer matches the cached head, rescanning full log")
+                return self._deliver(logs, 0)
+            return self._deliver(logs, known)
+
+    # ------------------ REALTIME ------------------
+    def note_live(self, events):
+        # Events already seen through live capture extend the cached log, so the
+        # next count check does not download them again.
+        with self._lock:
+            if self.record_count is not None and events:
+                self.logs.append(events)
+                self.record_count += len(events)
+            if self.delivered is not None and events:
+                self.delivered += len(events)
+                self.delivered_last = events[-1]
+
+    def capture(self, conn, on_events, duration, should_stop, timeout=1, flush_after=0.5):
+        # Stream realtime punches for up to `duration` seconds to on_events.
+        # A batch is flushed on a capture timeout, at 100 punches, or once its
+        # first punch has waited flush_after seconds, so a steady stream of
+        # check-ins is never held back waiting for a quiet moment. Returns
+        # False if the firmware does not support event capture.
+        if self.live_supported is False:
+            return False
+        deadline = time_module.monotonic() + duration
+        buffered = []
+        first = None
+        try:
+            for event in conn.live_capture(new_timeout=timeout):
+                self.live_supported = True
+                if event is not None:
+                    if not buffered:
+                        first = time_module.monotonic()
+                    buffered.append(event)
+                if buffered and (event is None or len(buffered) >= 100
+                                 or time_module.monotonic() - first >= flush_after):
+                    self.note_live(buffered)
+                    on_events(buffered)
+                    buffered = []
+                if should_stop() or time_module.monotonic() >= deadline:
+                    # The generator restores the socket and unregisters events on exit
+                    conn.end_live_capture = True
+        except Exception as e:
+            if self.live_supported is None:
+                logger.warning(f"Live capture not supported by device: {e}")
+                self.live_supported = False
+                return False
+            raise
+        if buffered:
+            self.note_live(buffered)
+            on_events(buffered)
+        return True
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
+import os
+import random
+import threading
+import time as time_module
+
+from attendance_system import ZKTecoAttendance, ALLOWED_DAYS, DEFAULT_API_URL, DEFAULT_API_KEY
+from sync_sender import LogSender
+from sync_outbox import Outbox
+from sync_dedup import AckIndex
+from punch_cache import PunchCache
+from attendance_rollups import AttendanceRollups
+from poll_schedule import PollSchedule, day_windows
+from user_directory import UserDirectory
+
+logger = logging.getLogger(__name__)
+
+
+class FleetDevice:
+    # A fleet member plus its poll schedule
+    def __init__(self, name, device):
+        self.name = name
+        self.device = device
+        self.failures = 0
+        self.next_poll = 0.0
+        self.last_error = None
+
+
+class DeviceFleet:
+    # Polls several terminals concurrently from one process. Every device has
+    # its own connection, checkpoint file and backoff, while the punch cache,
+    # outbox and uploader are shared so all records leave through one pipeline.
+    def __init__(self, devices, api_url=DEFAULT_API_URL, api_key=DEFAULT_API_KEY,
+                 poll_interval=5, idle_interval=3600, service_windows=None,
+                 db_path="attendance.db", state_dir=".",
+                 max_workers=None, max_backoff=900, upload_concurrency=4,
+                 batch_mode=None, batch_size=500, batch_url=None):
+        self.poll_interval = poll_interval
+        self.schedule = PollSchedule(service_windows or day_windows(ALLOWED_DAYS),
+                                     active_interval=poll_interval, idle_interval=idle_interval)
+        self.max_backoff = max_backoff
+        self.sender = LogSender(api_url, api_key, concurrency=upload_concurrency,
+                                batch_mode=batch_mode, batch_size=batch_size, batch_url=batch_url)
+        self.dedup = AckIndex(db_path)
+        self.outbox = Outbox(db_path, dedup=self.dedup)
+        self.cache = PunchCache(db_path)
+        self.rollups = AttendanceRollups(db_path, service_days=self.schedule.service_days)
+        self.directory = UserDirectory(db_path)
+        self.users = {}
+        self.last_api_status = None
+
+        os.makedirs(state_dir, exist_ok=True)
+        self.members = []
+        for spec in devices:
+            if isinstance(spec, str):
+                spec = {"ip_address": spec}
+            spec = dict(spec)
+            ip_address = spec.pop("ip_address")
+            name = spec.pop("name", None) or f"{ip_address}_{spec.get('port', 4370)}"
+            # Per-device state the fleet does not share (clock corrections) lives in the same database
+            spec.setdefault("db_path", db_path)
+            device = ZKTecoAttendance(
+                ip_address, api_url=api_url, api_key=api_key, schedule=self.schedule,
+                last_sync_file=os.path.join(state_dir, f"last_sync_{name}.txt"),
+                auto_sync=False, sender=self.sender, outbox=self.outbox, cache=self.cache,
+                rollups=self.rollups, dedup=self.dedup, directory=self.directory, **spec)
+            self.members.append(FleetDevice(name, device))
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.members)),
+                                           thread_name_prefix="fleet-poll")
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # ------------------ LIFECYCLE ------------------
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, drain=True):
+        # Stop polling, optionally push whatever is already queued, then disconnect
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.executor.shutdown(wait=True)
+        if drain:
+            sent = self.outbox.drain(self.sender, 2000)
+            logger.info(f"Final drain uploaded {sent} queued logs")
+            for member in self.members:
+                if member.device.device_serial:
+                    member.device._update_checkpoint()
+        for member in self.members:
+            member.device.disconnect()
+        self.sender.close()
+
+    def reconcile(self, start_date, end_date):
+        # The index is shared, so one listing covers every device
+        return self.members[0].device.reconcile(start_date, end_date) if self.members else None
+
+    # ------------------ POLLING ------------------
+    def _merge_users(self, device):
+        # First device to know a user_id names it
+        for user_id, name in device.users.items():
+            self.users.setdefault(user_id, name)
+
+    def _backoff(self, member):
+        delay = min(self.max_backoff, self.poll_interval * 2 ** (member.failures - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _poll(self, member):
+        device = member.device
+        try:
+            # After the first connect the device's supervisor handles reconnects
+            if not device.connection.is_open:
+                device.connect()
+                if not device.conn:
+                    raise ConnectionError(f"Could not connect to {device.ip_address}")
+            queued = device.poll_once()
+            # Device names arrive in the background and may change between polls
+            self._merge_users(device)
+            member.failures = 0
+            member.last_error = None
+            member.next_poll = time_module.monotonic() + self.schedule.next_delay()
+            return queued
+        except Exception as e:
+            member.failures += 1
+            member.last_error = str(e)
+            delay = self._backoff(member)
+            member.next_poll = time_module.monotonic() + delay
+            logger.warning(f"Poll failed for {member.name}: {e}; retrying in {delay:.0f}s")
+            return 0
+
+    def wake(self):
+        # Poll every device and upload now instead of waiting out the schedule
+        for member in self.members:
+            if not member.failures:
+                member.next_poll = 0.0
+        self._wake.set()
+
+    def poll_due(self):
+        # Poll every device that is due, all at once, and wait for them
+        now = time_module.monotonic()
+        due = [m for m in self.members if m.next_poll <= now]
+        futures = [self.executor.submit(self._poll, m) for m in due]
+        wait(futures)
+        return sum(f.result() for f in futures)
+
+    def _run(self):
+        logger.info(f"Starting fleet sync for {len(self.members)} devices...")
+        recovered = self.outbox.recover()
+        if recovered:
+            logger.info(f"Recovered {recovered} in-flight logs from outbox")
+
+        while not self._stop.is_set():
+            try:
+                self.poll_due()
+                self.outbox.drain(self.sender, 2000, lambda: not self._stop.is_set())
+                self.last_api_status = self.sender.last_status
+                for member in self.members:
+                    if member.device.device_serial:
+                        member.device._update_checkpoint()
+            except Exception as e:
+                logger.error(f"Fleet sync error: {e}")
+
+            delay = self.schedule.next_delay()
+            if self.members:
+                delay = min(m.next_poll for m in self.members) - time_module.monotonic()
+            retry = self.outbox.next_retry()
+            if retry is not None:
+                delay = min(delay, retry)
+            self._wake.wait(max(1.0, delay))
+            self._wake.clear()
+
+    # ------------------ STATUS ------------------
+    def get_sync_status(self):
+        return {
+            "devices": {
+                m.name: {
+                    "connected": bool(m.device.conn),
+                    "device_serial": m.device.device_serial,
+                    "last_sync_time": m.device.last_sync_time,
+                    "failures": m.failures,
+                    "last_error": m.last_error,
+                }
+                for m in self.members
+            },
+            "last_api_status": self.last_api_status,
+            "outbox_depth": self.outbox.depth(),
+        }
@@ -0,0 +1,89 @@
+from collections import namedtuple
+import calendar
+from datetime import datetime, time
+
+# One recurring service: Python weekday (Monday = 0) plus local start and end
+# times. An end at or before the start runs past midnight; end time(0) with
+# start time(0) is the whole day.
+ServiceWindow = namedtuple("ServiceWindow", ["weekday", "start", "end"])
+
+DAY = 86400
+WEEK = 7 * DAY
+
+WEEKDAYS = {name.lower(): i for i, name in enumerate(calendar.day_name)}
+WEEKDAYS.update({name.lower(): i for i, name in enumerate(calendar.day_abbr)})
+
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _weekday(day):
+    if isinstance(day, int):
+        if not 0 <= day <= 6:
+            raise ValueError(f"Weekday {day} out of range, expected 0 (Monday) to 6 (Sunday)")
+        return day
+    try:
+        return WEEKDAYS[day.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown weekday {day!r}")
+
+
+def parse_windows(spec):
+    # Config form → ServiceWindows:
+    #   [{"days": ["sunday"], "start": "07:00", "end": "13:00"}, {"day": "wednesday"}]
+    # start/end default to the whole day
+    windows = []
+    for entry in spec:
+        days = entry.get("days") or [entry["day"]]
+        start = time.fromisoformat(entry.get("start", "00:00"))
+        end = time.fromisoformat(entry.get("end", "00:00"))
+        windows.extend(ServiceWindow(_weekday(day), start, end) for day in days)
+    return windows
+
+
+def day_windows(days):
+    # Whole-day windows for a set of weekdays
+    return [ServiceWindow(day, time(0), time(0)) for day in sorted(days)]
+
+
+class PollSchedule:
+    # How long the sync loop should sleep before the next device poll: every
+    # active_interval seconds inside a service window, otherwise idle_interval,
+    # cut short so polling speeds up as soon as the next window opens.
+    def __init__(self, windows, active_interval=5, idle_interval=3600):
+        if not windows:
+            raise ValueError("At least one service window is required")
+        self.windows = sorted(windows)
+        self.active_interval = active_interval
+        self.idle_interval = max(idle_interval, active_interval)
+        # (start, end) in seconds since Monday 00:00
+        self._spans = []
+        for window in self.windows:
+            start = window.weekday * DAY + _seconds(window.start)
+            length = (_seconds(window.end) - _seconds(window.start)) % DAY or DAY
+            self._spans.append((start, start + length))
+
+    @property
+    def service_days(self):
+        # Weekdays whose punches are uploaded, by the day each window starts on
+        return {window.weekday for window in self.windows}
+
+    def _week_seconds(self, now):
+        return now.weekday() * DAY + _seconds(now.time())
+
+    def active(self, now=None):
+        offset = self._week_seconds(now or datetime.now())
+        # A window that wraps past Sunday midnight also covers the start of the week
+        return any(start <= offset < end or start <= offset + WEEK < end
+                   for start, end in self._spans)
+
+    def until_next_window(self, now=None):
+        offset = self._week_seconds(now or datetime.now())
+        return min((start - offset) % WEEK for start, _ in self._spans)
+
+    def next_delay(self, now=None):
+        now = now or datetime.now()
+        if self.active(now):
+            return self.active_interval
+        return max(1, min(self.idle_interval, self.until_next_window(now)))
@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+from punch_store import PunchStore
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    device_serial TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    punch INTEGER NOT NULL,
+    status INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (device_serial, user_id, timestamp, punch)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS punches_timestamp ON punches (timestamp);
+CREATE INDEX IF NOT EXISTS punches_user ON punches (user_id, timestamp);
+"""
+
+
+class PunchCache:
+    # Every punch seen from the device, so reports can be answered locally
+    def __init__(self, path="attendance.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, device_serial, logs):
+        if not len(logs):
+            return 0
+        if isinstance(logs, PunchStore):
+            rows = logs.sql_rows(device_serial)
+        else:
+            rows = [(device_serial, str(log.user_id), log.timestamp.isoformat(),
+                     int(log.punch), int(log.status or 0)) for log in logs]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._db.total_changes
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO punches (device_serial, user_id, timestamp, punch, status) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+                added = self._db.total_changes - before
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return added
+
+    def has_data(self, device_serial=None):
+        sql, params = "SELECT 1 FROM punches", []
+        if device_serial is not None:
+            sql, params = sql + " WHERE device_serial = ?", [device_serial]
+        with self._lock:
+            return self._db.execute(sql + " LIMIT 1", params).fetchone() is not None
+
+    def query(self, start=None, end=None, user_id=None, device_serial=None):
+        # Punches in [start, end] as a user_id / timestamp / punch frame
+        import pandas as pd
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            params.append(end.isoformat())
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(str(user_id))
+        if device_serial is not None:
+            clauses.append("device_serial = ?")
+            params.append(device_serial)
+        sql = "SELECT user_id, timestamp, punch FROM punches"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        user_ids, timestamps, punches = zip(*rows) if rows else ((), (), ())
+        return pd.DataFrame({
+            'user_id': list(user_ids),
+            'timestamp': pd.to_datetime(pd.Series(timestamps, dtype=object), format="ISO8601"),
+            'punch': pd.Series(punches, dtype="int64"),
+        })
@@ -0,0 +1,228 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+
+
+PunchRecord = namedtuple("PunchRecord", ["user_id", "timestamp", "punch", "status"])
+
+EPOCH = datetime(1970, 1, 1)
+# 1970-01-01 was a Thursday (Python weekday 3)
+EPOCH_WEEKDAY = 3
+
+
+def to_epoch(timestamp):
+    # Device wall-clock time as whole seconds since 1970-01-01, no timezone applied
+    return int((timestamp.replace(tzinfo=None) - EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+class PunchStore:
+    # Attendance log held as columns instead of pyzk Attendance objects:
+    # user ids interned to int32 codes, timestamps as int64 epoch seconds and
+    # punch/status as uint8. Rows are only ever appended, in device order, so
+    # views handed out earlier stay valid. Iterating yields PunchRecord tuples
+    # with the same attributes as pyzk's Attendance, built on demand.
+    def __init__(self, capacity=1024, _users=None):
+        # The intern table is shared with views so codes mean the same everywhere
+        self.user_ids, self._codes_by_id = _users if _users is not None else ([], {})
+        self._size = 0
+        self._user = np.empty(capacity, dtype=np.int32)
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._punch = np.empty(capacity, dtype=np.uint8)
+        self._status = np.empty(capacity, dtype=np.uint8)
+        # Device logs are nearly always appended in time order; only when they
+        # are not is an argsort needed, computed once and kept until the next append
+        self._in_order = True
+        self._order = None
+
+    @classmethod
+    def from_logs(cls, logs):
+        store = cls(max(16, len(logs)))
+        store.append(logs)
+        return store
+
+    # ------------------ COLUMNS ------------------
+    @property
+    def user_codes(self):
+        return self._user[:self._size]
+
+    @property
+    def timestamps(self):
+        return self._ts[:self._size]
+
+    @property
+    def punches(self):
+        return self._punch[:self._size]
+
+    @property
+    def statuses(self):
+        return self._status[:self._size]
+
+    @property
+    def nbytes(self):
+        return self._user.nbytes + self._ts.nbytes + self._punch.nbytes + self._status.nbytes
+
+    def weekdays(self):
+        # Python weekday (Monday = 0) of every row
+        return (self.timestamps // 86400 + EPOCH_WEEKDAY) % 7
+
+    # ------------------ APPEND ------------------
+    def intern(self, user_id):
+        user_id = str(user_id)
+        code = self._codes_by_id.get(user_id)
+        if code is None:
+            code = self._codes_by_id[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return code
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._ts):
+            return
+        capacity = max(needed, 2 * len(self._ts))
+        for name in ("_user", "_ts", "_punch", "_status"):
+            old = getattr(self, name)
+            grown = np.empty(capacity, dtype=old.dtype)
+            grown[:self._size] = old[:self._size]
+            setattr(self, name, grown)
+
+    def append(self, logs):
+        # Attendance objects (or anything with user_id/timestamp/punch/status)
+        count = len(logs)
+        if not count:
+            return 0
+        if isinstance(logs, PunchStore):
+            codes = logs.user_codes
+            if logs.user_ids is not self.user_ids:
+                codes = np.array([self.intern(u) for u in logs.user_ids], dtype=np.int32)[codes]
+            return self.append_columns(codes, logs.timestamps, logs.punches, logs.statuses)
+        intern = self.intern
+        return self.append_columns(
+            np.fromiter((intern(log.user_id) for log in logs), dtype=np.int32, count=count),
+            np.fromiter((to_epoch(log.timestamp) for log in logs), dtype=np.int64, count=count),
+            np.fromiter((log.punch for log in logs), dtype=np.uint8, count=count),
+            np.fromiter((log.status or 0 for log in logs), dtype=np.uint8, count=count))
+
+    def append_columns(self, user_codes, timestamps, punches, statuses):
+        count = len(timestamps)
+        self._reserve(count)
+        start, end = self._size, self._size + count
+        self._user[start:end] = user_codes
+        self._ts[start:end] = timestamps
+        self._punch[start:end] = punches
+        self._status[start:end] = statuses
+        self._size = end
+
+        if self._in_order:
+            new = self._ts[start:end]
+            self._in_order = ((start == 0 or new[0] >= self._ts[start - 1])
+                              and bool(np.all(new[1:] >= new[:-1])))
+        self._order = None
+        return count
+
+    # ------------------ ACCESS ------------------
+    def __len__(self):
+        return self._size
+
+    def record(self, i):
+        return PunchRecord(self.user_ids[self._user[i]], from_epoch(self._ts[i]),
+                           int(self._punch[i]), int(self._status[i]))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self._size)
+            if step != 1:
+                raise ValueError("PunchStore slices must be contiguous")
+            return self.view(start, stop)
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("punch index out of range")
+        return self.record(i)
+
+    def __iter__(self):
+        user_ids = self.user_ids
+        for code, ts, punch, status in zip(self.user_codes.tolist(), self.timestamps.tolist(),
+                                           self.punches.tolist(), self.statuses.tolist()):
+            yield PunchRecord(user_ids[code], EPOCH + timedelta(seconds=ts), punch, status)
+
+    def view(self, start=0, stop=None):
+        # Rows [start, stop) sharing this store's arrays; no copy
+        stop = self._size if stop is None else min(stop, self._size)
+        start = min(start, stop)
+        part = PunchStore(0, _users=(self.user_ids, self._codes_by_id))
+        part._user = self._user[start:stop]
+        part._ts = self._ts[start:stop]
+        part._punch = self._punch[start:stop]
+        part._status = self._status[start:stop]
+        part._size = stop - start
+        part._in_order = self._in_order
+        return part
+
+    def take(self, mask_or_index):
+        # Copy of the selected rows as a new store
+        part = PunchStore(0, _users=(self.user_ids, self._codes_by_id))
+        part._user = self.user_codes[mask_or_index]
+        part._ts = self.timestamps[mask_or_index]
+        part._punch = self.punches[mask_or_index]
+        part._status = self.statuses[mask_or_index]
+        part._size = len(part._ts)
+        part._in_order = self._in_order and getattr(mask_or_index, "dtype", None) == np.bool_
+        return part
+
+    def shifted(self, seconds):
+        # Copy with timestamps moved by seconds (a scalar or one value per row)
+        part = self.take(np.ones(self._size, dtype=bool))
+        part._ts = part._ts + seconds
+        part._in_order = bool(np.all(part._ts[1:] >= part._ts[:-1]))
+        return part
+
+    def sorted_index(self):
+        # Row positions in time order
+        if self._in_order:
+            return np.arange(self._size)
+        if self._order is None:
+            self._order = np.argsort(self.timestamps, kind="stable")
+        return self._order
+
+    def between(self, start=None, end=None):
+        # Row positions with start <= timestamp <= end, in time order
+        if self._in_order:
+            order, ordered_ts = None, self.timestamps
+        else:
+            order = self.sorted_index()
+            ordered_ts = self.timestamps[order]
+        lo = 0 if start is None else int(np.searchsorted(ordered_ts, to_epoch(start), side="left"))
+        hi = self._size if end is None else int(np.searchsorted(ordered_ts, to_epoch(end), side="right"))
+        return np.arange(lo, hi) if order is None else order[lo:hi]
+
+    # ------------------ SQL / PANDAS ------------------
+    def sql_rows(self, device_serial, with_status=True):
+        # (serial, user_id, ISO timestamp, punch[, status]) tuples for executemany
+        user_ids = self.user_ids
+        for code, ts, punch, status in zip(self.user_codes.tolist(), self.timestamps.tolist(),
+                                           self.punches.tolist(), self.statuses.tolist()):
+            row = (device_serial, user_ids[code], (EPOCH + timedelta(seconds=ts)).isoformat(), punch)
+            yield row + (status,) if with_status else row
+
+    def frame(self, index=None):
+        # user_id / timestamp / punch / status DataFrame. Timestamps are a
+        # datetime64 view of the epoch column and user_id is a Categorical over
+        # the intern table, so the numeric columns are not copied.
+        import pandas as pd
+        codes, ts = self.user_codes, self.timestamps
+        punches, statuses = self.punches, self.statuses
+        if index is not None:
+            codes, ts, punches, statuses = codes[index], ts[index], punches[index], statuses[index]
+        return pd.DataFrame({
+            'user_id': pd.Categorical.from_codes(codes, categories=pd.Index(self.user_ids, dtype=object)),
+            'timestamp': ts.view("datetime64[s]"),
+            'punch': punches,
+            'status': statuses,
+        }, copy=False)
+
+    def clear(self):
+        self.__init__(_users=(self.user_ids, self._codes_by_id))
@@ -0,0 +1,123 @@
+# Headless sync daemon: polls the configured devices and uploads new punches
+# until SIGINT/SIGTERM, then drains the outbox and exits.
+#
+#   python sync_daemon.py --config sync_config.json
+
+import time as time_module
+_STARTED = time_module.perf_counter()
+
+import argparse
+from datetime import datetime, timedelta
+import json
+import logging
+import signal
+import sys
+import threading
+
+from device_fleet import DeviceFleet
+from poll_schedule import parse_windows
+from sync_metrics import start_metrics_server
+
+logger = logging.getLogger("sync_daemon")
+
+# Config keys passed straight through to DeviceFleet
+FLEET_OPTIONS = (
+    "api_url", "api_key", "poll_interval", "idle_interval", "db_path", "state_dir", "max_workers",
+    "max_backoff", "upload_concurrency", "batch_mode", "batch_size", "batch_url",
+)
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, for journald / log shippers
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def load_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not config.get("devices"):
+        raise ValueError(f"{path}: 'devices' must list at least one device")
+    return config
+
+
+def setup_logging(config):
+    if config.get("log_file"):
+        handler = logging.FileHandler(config["log_file"], encoding="utf-8")
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    if config.get("log_format", "json") == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(config.get("log_level", "INFO").upper())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless ZKTeco attendance sync daemon")
+    parser.add_argument("--config", default="sync_config.json", help="JSON config file")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    setup_logging(config)
+
+    options = {key: config[key] for key in FLEET_OPTIONS if key in config}
+    if config.get("service_windows"):
+        options["service_windows"] = parse_windows(config["service_windows"])
+    fleet = DeviceFleet(config["devices"], **options)
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, draining and shutting down...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    if hasattr(signal, "SIGBREAK"):
+        signal.signal(signal.SIGBREAK, handle_signal)
+
+    metrics_server = None
+    if config.get("metrics_port"):
+        metrics_server = start_metrics_server(config["metrics_port"],
+                                              config.get("metrics_host", "127.0.0.1"))
+
+    if config.get("reconcile_days"):
+        # Learn what the API already holds before the first poll re-reads the
+        # device logs, so a fresh install or lost state only uploads the delta
+        end = datetime.now()
+        try:
+            known = fleet.reconcile(end - timedelta(days=config["reconcile_days"]), end)
+            if known is None:
+                logger.warning("API does not list known records, skipping reconcile")
+        except Exception as e:
+            logger.warning(f"Reconcile failed, continuing without it: {e}")
+
+    fleet.start()
+    logger.info(f"Sync daemon started in {time_module.perf_counter() - _STARTED:.3f}s "
+                f"for {len(fleet.members)} devices")
+
+    # Short waits keep the main thread responsive to signals on Windows too
+    while not stop.wait(1):
+        pass
+
+    fleet.stop(drain=not config.get("skip_final_drain", False))
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    logger.info("Sync daemon stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
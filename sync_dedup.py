@@ -0,0 +1,164 @@
+from datetime import datetime
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import numpy as np
+
+from sync_sender import LAGOS_TZ
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS acked_fingerprints (
+    fp INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS ack_baselines (
+    device_serial TEXT PRIMARY KEY,
+    acked_through TEXT
+);
+"""
+
+# Rows per IN (...) lookup, well under SQLite's bound parameter limit
+LOOKUP_CHUNK = 500
+
+
+def fingerprint(user_id, timestamp):
+    # 64-bit identity of a punch as the API sees it: user id plus the
+    # timestamp normalised to the upload timezone
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=LAGOS_TZ)
+    key = f"{user_id}|{timestamp.astimezone(LAGOS_TZ).isoformat()}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little", signed=True)
+
+
+def fingerprints(records):
+    return np.fromiter((fingerprint(r.user_id, r.timestamp) for r in records),
+                       dtype=np.int64, count=len(records))
+
+
+class AckIndex:
+    # Fingerprints of every punch the API has acknowledged, so re-reading old
+    # logs (lost checkpoint, device clock moved back, full resync) never
+    # uploads them again. The set lives in SQLite; an in-memory Bloom filter
+    # in front answers most "not acked yet" lookups without touching disk.
+    def __init__(self, path="attendance.db", capacity=1_000_000, error_rate=0.001):
+        self.path = path
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self.created = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'acked_fingerprints'"
+        ).fetchone() is None
+        self._db.executescript(SCHEMA)
+        self.count = self._db.execute("SELECT COUNT(*) FROM acked_fingerprints").fetchone()[0]
+        self._baselines = {serial: datetime.fromisoformat(ts) if ts else None for serial, ts in
+                           self._db.execute("SELECT device_serial, acked_through FROM ack_baselines")}
+        self._build_filter(max(capacity, 2 * self.count))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ------------------ BLOOM FILTER ------------------
+    def _build_filter(self, capacity):
+        self.capacity = capacity
+        self._bits = max(64, int(-capacity * math.log(self.error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._bits / capacity * math.log(2)))
+        self._filter = np.zeros((self._bits + 7) // 8, dtype=np.uint8)
+        cursor = self._db.execute("SELECT fp FROM acked_fingerprints")
+        while True:
+            rows = cursor.fetchmany(100_000)
+            if not rows:
+                break
+            self._set_bits(np.array([row[0] for row in rows], dtype=np.int64))
+
+    def _positions(self, fps):
+        # Double hashing: k probe positions from the two 32-bit halves
+        fps = fps.view(np.uint64)
+        h1 = fps & np.uint64(0xFFFFFFFF)
+        h2 = (fps >> np.uint64(32)) | np.uint64(1)
+        probes = np.arange(self._hashes, dtype=np.uint64)[:, None]
+        return (h1 + probes * h2) % np.uint64(self._bits)
+
+    def _set_bits(self, fps):
+        positions = self._positions(fps).ravel()
+        np.bitwise_or.at(self._filter, (positions >> np.uint64(3)).astype(np.intp),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+
+    def _maybe_contains(self, fps):
+        positions = self._positions(fps)
+        bits = self._filter[(positions >> np.uint64(3)).astype(np.intp)]
+        return ((bits >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=0).astype(bool)
+
+    # ------------------ SET ------------------
+    def contains(self, fps):
+        # Boolean mask of fingerprints already acknowledged
+        fps = np.asarray(fps, dtype=np.int64)
+        with self._lock:
+            found = self._maybe_contains(fps) if len(fps) else np.zeros(0, dtype=bool)
+            candidates = np.flatnonzero(found)
+            if not len(candidates):
+                return found
+            # Confirm Bloom hits against the table to rule out false positives
+            known = set()
+            values = fps[candidates].tolist()
+            for i in range(0, len(values), LOOKUP_CHUNK):
+                chunk = values[i:i + LOOKUP_CHUNK]
+                known.update(row[0] for row in self._db.execute(
+                    f"SELECT fp FROM acked_fingerprints WHERE fp IN ({','.join('?' * len(chunk))})", chunk))
+        found[candidates] = [fp in known for fp in values]
+        return found
+
+    def add(self, fps):
+        fps = np.unique(np.asarray(fps, dtype=np.int64))
+        if not len(fps):
+            return 0
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO acked_fingerprints (fp) VALUES (?)",
+                                 ((fp,) for fp in fps.tolist()))
+            added = self._db.total_changes - before
+            self.count += added
+            if self.count > self.capacity:
+                # Grow before the false-positive rate degrades
+                self._build_filter(2 * self.count)
+            else:
+                self._set_bits(fps)
+        return added
+
+    # ------------------ BASELINES ------------------
+    # The checkpoint a device had when the index first saw it. Punches at or
+    # before it were uploaded by timestamp before there was an index and count
+    # as acknowledged; the index only decides for punches after it.
+    def has_baseline(self, device_serial):
+        return device_serial in self._baselines
+
+    def baseline(self, device_serial):
+        return self._baselines.get(device_serial)
+
+    def set_baseline(self, device_serial, acked_through):
+        # Recorded once per device; acked_through is None if nothing was acknowledged
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO ack_baselines (device_serial, acked_through) VALUES (?, ?)",
+                (device_serial, acked_through.isoformat() if acked_through else None))
+            row = self._db.execute(
+                "SELECT acked_through FROM ack_baselines WHERE device_serial = ?", (device_serial,)).fetchone()
+            self._baselines[device_serial] = datetime.fromisoformat(row[0]) if row[0] else None
+        if self._baselines[device_serial]:
+            logger.info(f"Ack index for {device_serial} starts after {self._baselines[device_serial]}")
+        return self._baselines[device_serial]
+
+    # ------------------ RECORDS ------------------
+    def acked_mask(self, records):
+        return self.contains(fingerprints(records)) if len(records) else np.zeros(0, dtype=bool)
+
+    def add_records(self, records):
+        return self.add(fingerprints(records)) if len(records) else 0
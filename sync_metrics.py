@@ -0,0 +1,227 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import logging
+import threading
+import time as time_module
+
+logger = logging.getLogger(__name__)
+
+
+# Latency buckets in seconds, from a LAN device read up to the 50 s upload timeout
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{self._label_text(key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def max(self):
+        with self._lock:
+            return max(self._values.values(), default=None)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0,
+                                             "count": 0, "last": 0.0}
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry["counts"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+            entry["last"] = value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def last(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry["last"] if entry else None
+
+    def latest(self):
+        # Slowest of the most recent observations across all label sets
+        with self._lock:
+            return max((entry["last"] for entry in self._values.values()), default=None)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, dict(entry, counts=list(entry["counts"])))
+                           for key, entry in self._values.items())
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_text(key, [('le', '+Inf')])} {entry['count']}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {entry['sum']}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {entry['count']}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._started = time_module.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time_module.perf_counter() - self._started, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ------------------ DEVICE ------------------
+DEVICE_FETCH_SECONDS = REGISTRY.register(Histogram(
+    "zk_device_fetch_seconds", "Time spent reading new records from the device", ["device"]))
+RECORDS_FETCHED = REGISTRY.register(Counter(
+    "zk_records_fetched_total", "Records handed over by the device", ["device"]))
+RECORDS_NEW = REGISTRY.register(Counter(
+    "zk_records_new_total", "New records queued for upload", ["device", "weekday"]))
+RECORDS_SKIPPED = REGISTRY.register(Counter(
+    "zk_records_skipped_total", "New records skipped by the sync day filter", ["device", "weekday"]))
+DEVICE_ERRORS = REGISTRY.register(Counter(
+    "zk_device_errors_total", "Failed device polls", ["device"]))
+CLOCK_SKEW = REGISTRY.register(Gauge(
+    "zk_device_clock_skew_seconds", "Smoothed device clock minus host clock", ["device"]))
+CLOCK_ANOMALIES = REGISTRY.register(Counter(
+    "zk_device_clock_anomalies_total", "Clock jumps, excessive skew and future punches", ["device", "kind"]))
+
+# ------------------ UPLOAD ------------------
+UPLOAD_SECONDS = REGISTRY.register(Histogram(
+    "zk_upload_seconds", "Latency of one upload request", ["mode"]))
+UPLOADED_RECORDS = REGISTRY.register(Counter(
+    "zk_uploaded_records_total", "Records sent to the API by result", ["result"]))
+UPLOAD_ERRORS = REGISTRY.register(Counter(
+    "zk_upload_errors_total", "Failed upload requests by HTTP status", ["status"]))
+
+# ------------------ QUEUE ------------------
+OUTBOX_DEPTH = REGISTRY.register(Gauge(
+    "zk_outbox_depth", "Records waiting in the outbox"))
+CHECKPOINT_LAG = REGISTRY.register(Gauge(
+    "zk_checkpoint_lag_seconds", "Newest queued punch minus the acknowledged watermark", ["device"]))
+
+
+def summary():
+    # Compact numbers for the GUI status bar
+    return {
+        "fetch_seconds": DEVICE_FETCH_SECONDS.latest(),
+        "upload_seconds": UPLOAD_SECONDS.latest(),
+        "records_new": RECORDS_NEW.total(),
+        "records_skipped": RECORDS_SKIPPED.total(),
+        "uploaded": UPLOADED_RECORDS.value(result="ok"),
+        "upload_failed": UPLOADED_RECORDS.value(result="failed"),
+        "upload_rejected": UPLOADED_RECORDS.value(result="rejected"),
+        "upload_errors": UPLOAD_ERRORS.total(),
+        "outbox_depth": OUTBOX_DEPTH.value(),
+        "checkpoint_lag": CHECKPOINT_LAG.max(),
+    }
+
+
+# ------------------ ENDPOINT ------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    # Prometheus text endpoint on a daemon thread; returns the server for shutdown()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
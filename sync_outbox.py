@@ -0,0 +1,262 @@
+from collections import namedtuple
+import logging
+from datetime import datetime
+import sqlite3
+import threading
+import time as time_module
+from sync_metrics import OUTBOX_DEPTH, UPLOADED_RECORDS
+from punch_store import PunchStore
+
+logger = logging.getLogger(__name__)
+
+
+# Row states
+PENDING = 0
+IN_FLIGHT = 1
+ACKED = 2
+# Rejected by the API, or out of attempts; kept for inspection, never retried
+FAILED = 3
+
+OutboxRecord = namedtuple("OutboxRecord", ["device_serial", "user_id", "timestamp", "punch"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    device_serial TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    punch INTEGER NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (device_serial, user_id, timestamp, punch)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, timestamp);
+CREATE TABLE IF NOT EXISTS read_checkpoints (
+    device_serial TEXT PRIMARY KEY,
+    last_read TEXT NOT NULL
+);
+"""
+
+
+class Outbox:
+    # dedup: optional AckIndex of punches the API already has. Those are never
+    # queued, are acknowledged without a request if queued anyway, and every
+    # upload the API accepts is added to it.
+    # max_attempts: failed uploads after which a record is given up as FAILED
+    # (None retries forever); records the API rejects are FAILED at once.
+    def __init__(self, path="attendance.db", retry_base=30, retry_max=3600, dedup=None,
+                 max_attempts=None):
+        self.path = path
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.dedup = dedup
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        if dedup is not None and dedup.created:
+            # Seed a new index with what this outbox already had acknowledged
+            rows = self._db.execute(
+                "SELECT device_serial, user_id, timestamp, punch FROM outbox WHERE state = ?",
+                (ACKED,)).fetchall()
+            dedup.add_records([OutboxRecord(s, u, datetime.fromisoformat(ts), p) for s, u, ts, p in rows])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ------------------ DEVICE SIDE ------------------
+    def enqueue(self, device_serial, logs, last_read=None):
+        # Insert a whole device read in one transaction; duplicates are ignored.
+        # last_read moves the device read checkpoint in the same transaction.
+        if self.dedup is not None and len(logs):
+            fresh = ~self.dedup.acked_mask(logs)
+            if not fresh.all():
+                logger.debug(f"Skipping {int((~fresh).sum())} logs the API already acknowledged")
+                logs = (logs.take(fresh) if isinstance(logs, PunchStore)
+                        else [log for log, keep in zip(logs, fresh) if keep])
+        if isinstance(logs, PunchStore):
+            rows = logs.sql_rows(device_serial, with_status=False)
+        else:
+            rows = [(device_serial, str(log.user_id), log.timestamp.isoformat(), int(log.punch))
+                    for log in logs]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._db.total_changes
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO outbox (device_serial, user_id, timestamp, punch) "
+                    "VALUES (?, ?, ?, ?)", rows)
+                inserted = self._db.total_changes - before
+                if last_read is not None:
+                    self._db.execute(
+                        "INSERT INTO read_checkpoints (device_serial, last_read) VALUES (?, ?) "
+                        "ON CONFLICT(device_serial) DO UPDATE SET last_read = excluded.last_read "
+                        "WHERE excluded.last_read > read_checkpoints.last_read",
+                        (device_serial, last_read.isoformat()))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return inserted
+
+    def read_checkpoint(self, device_serial):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_read FROM read_checkpoints WHERE device_serial = ?",
+                (device_serial,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    # ------------------ UPLOAD SIDE ------------------
+    def recover(self):
+        # Anything left in flight by a crash goes back to pending
+        with self._lock:
+            cur = self._db.execute("UPDATE outbox SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT))
+        return cur.rowcount
+
+    def claim(self, limit=1000):
+        # Oldest due pending records, marked in flight
+        now = time_module.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT device_serial, user_id, timestamp, punch FROM outbox "
+                    "WHERE state = ? AND next_attempt <= ? ORDER BY timestamp LIMIT ?",
+                    (PENDING, now, limit)).fetchall()
+                self._db.executemany(
+                    "UPDATE outbox SET state = ? "
+                    "WHERE device_serial = ? AND user_id = ? AND timestamp = ? AND punch = ?",
+                    [(IN_FLIGHT,) + tuple(row) for row in rows])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [OutboxRecord(serial, user_id, datetime.fromisoformat(ts), punch)
+                for serial, user_id, ts, punch in rows]
+
+    def _keys(self, records):
+        return [(r.device_serial, r.user_id, r.timestamp.isoformat(), r.punch) for r in records]
+
+    def ack(self, records):
+        with self._lock:
+            self._db.executemany(
+                f"UPDATE outbox SET state = {ACKED} "
+                "WHERE device_serial = ? AND user_id = ? AND timestamp = ? AND punch = ?",
+                self._keys(records))
+
+    def release(self, records):
+        # Failed uploads go back to pending with exponential backoff per record,
+        # or to FAILED once they have used up max_attempts
+        now = time_module.time()
+        limit = self.max_attempts or 0
+        with self._lock:
+            self._db.executemany(
+                f"UPDATE outbox SET attempts = attempts + 1, "
+                f"state = CASE WHEN ? > 0 AND attempts + 1 >= ? THEN {FAILED} ELSE {PENDING} END, "
+                "next_attempt = ? + MIN(?, ? * (1 << MIN(attempts, 16))) "
+                "WHERE device_serial = ? AND user_id = ? AND timestamp = ? AND punch = ?",
+                [(limit, limit, now, self.retry_max, self.retry_base) + key for key in self._keys(records)])
+
+    def fail(self, records):
+        # Records the API rejected: resending them cannot succeed
+        with self._lock:
+            self._db.executemany(
+                f"UPDATE outbox SET state = {FAILED}, attempts = attempts + 1 "
+                "WHERE device_serial = ? AND user_id = ? AND timestamp = ? AND punch = ?",
+                self._keys(records))
+
+    def retry_failed(self, device_serial=None):
+        # Put FAILED records back in the queue, e.g. after fixing them on the API side
+        with self._lock:
+            cur = self._db.execute(
+                f"UPDATE outbox SET state = {PENDING}, attempts = 0, next_attempt = 0 "
+                f"WHERE state = {FAILED} AND (? IS NULL OR device_serial = ?)",
+                (device_serial, device_serial))
+        return cur.rowcount
+
+    def skip_acked(self, records):
+        # Ack claimed records the API already holds; returns the rest
+        if self.dedup is None or not records:
+            return records
+        known = self.dedup.acked_mask(records)
+        if not known.any():
+            return records
+        self.ack([r for r, k in zip(records, known) if k])
+        return [r for r, k in zip(records, known) if not k]
+
+    def settle(self, records, results):
+        # Ack what the sender delivered, give up on what the API rejected (None)
+        # and schedule the rest for retry
+        accepted = [r for r, ok in zip(records, results) if ok]
+        rejected = [r for r, ok in zip(records, results) if ok is None]
+        self.ack(accepted)
+        if self.dedup is not None:
+            self.dedup.add_records(accepted)
+        self.fail(rejected)
+        self.release([r for r, ok in zip(records, results) if ok is False])
+        UPLOADED_RECORDS.inc(len(accepted), result="ok")
+        UPLOADED_RECORDS.inc(len(records) - len(accepted) - len(rejected), result="failed")
+        UPLOADED_RECORDS.inc(len(rejected), result="rejected")
+        if rejected:
+            logger.warning(f"API rejected {len(rejected)} queued logs, not retrying them "
+                           f"(first: user {rejected[0].user_id} at {rejected[0].timestamp})")
+        logger.info(f"Uploaded {len(accepted)}/{len(records)} queued logs")
+        return len(accepted)
+
+    def drain(self, sender, batch_size=1000, should_continue=None):
+        # Upload due records oldest first through sender until nothing is due
+        sent = 0
+        while should_continue is None or should_continue():
+            claimed = self.claim(batch_size)
+            if not claimed:
+                break
+            records = self.skip_acked(claimed)
+            if not records:
+                continue
+            results = sender.send(records)
+            accepted = self.settle(records, results)
+            sent += accepted
+            if not accepted and False in results:
+                break
+        OUTBOX_DEPTH.set(self.depth())
+        return sent
+
+    # ------------------ STATUS ------------------
+    def next_retry(self):
+        # Seconds until the earliest pending record is due, or None if none are pending
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE state = ?", (PENDING,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time_module.time())
+
+    def failed(self):
+        with self._lock:
+            row = self._db.execute("SELECT COUNT(*) FROM outbox WHERE state = ?", (FAILED,)).fetchone()
+        return row[0]
+
+    def depth(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE state IN (?, ?)", (PENDING, IN_FLIGHT)).fetchone()
+        return row[0]
+
+    def acked_through(self, device_serial):
+        # Latest timestamp such that every record at or before it is acknowledged
+        # or FAILED; given-up records do not hold the watermark back
+        with self._lock:
+            oldest_open = self._db.execute(
+                "SELECT MIN(timestamp) FROM outbox WHERE device_serial = ? AND state IN (?, ?)",
+                (device_serial, PENDING, IN_FLIGHT)).fetchone()[0]
+            if oldest_open is None:
+                row = self._db.execute(
+                    "SELECT MAX(timestamp) FROM outbox WHERE device_serial = ? AND state IN (?, ?)",
+                    (device_serial, ACKED, FAILED)).fetchone()
+            else:
+                row = self._db.execute(
+                    "SELECT MAX(timestamp) FROM outbox "
+                    "WHERE device_serial = ? AND state IN (?, ?) AND timestamp < ?",
+                    (device_serial, ACKED, FAILED, oldest_open)).fetchone()
+        return datetime.fromisoformat(row[0]) if row[0] else None
@@ -0,0 +1,250 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from datetime import datetime, timezone, timedelta
+import threading
+import time as time_module
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from sync_metrics import UPLOAD_SECONDS, UPLOAD_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+LAGOS_TZ = timezone(timedelta(hours=1))
+
+# Statuses that mean the endpoint does not understand a JSON array body
+BATCH_REJECT_STATUSES = {400, 404, 405, 415, 422}
+# Per-record statuses the API uses for records it already has
+BATCH_OK_STATUSES = {"ok", "created", "success", "duplicate", "exists"}
+# Statuses that reject a record itself, so resending it cannot succeed
+RECORD_REJECT_STATUSES = {400, 413, 422}
+BATCH_REJECTED_STATUSES = {"rejected", "invalid"}
+
+
+class LogSender:
+    def __init__(self, api_url, api_key, concurrency=4, timeout=50,
+                 batch_mode=None, batch_size=500, batch_max_bytes=256 * 1024,
+                 batch_url=None):
+        # batch_mode: None batches only when a batch_url is configured. Batches
+        # posted to the single-record api_url are probed: they count only when
+        # the reply has per-record results, and until one has, a server error
+        # also falls back to per-record uploads.
+        self.api_url = api_url
+        self.api_key = api_key
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.batch_mode = bool(batch_url) if batch_mode is None else batch_mode
+        self.batch_size = batch_size
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_url = batch_url or api_url
+        # Arrays posted to api_url are not known to be understood
+        self._probe_batches = batch_url is None
+        self._batch_confirmed = False
+        self.last_status = None
+
+        # One keep-alive session shared by all workers; the pool is sized so
+        # every worker can hold its own connection to the API host.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"x-api-key": self.api_key, "Content-Type": "application/json"})
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    # ------------------ LIFECYCLE ------------------
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                    thread_name_prefix="log-sender")
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        self.session.close()
+
+    # ------------------ PAYLOADS ------------------
+    def build_payload(self, user_id, timestamp):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=LAGOS_TZ)
+        return {"user_id": str(user_id), "timestamp": timestamp.isoformat()}
+
+    def _chunk_payloads(self, payloads):
+        # Split payloads into (start_index, encoded) chunks bounded by record count and body size
+        chunk, chunk_bytes, start = [], 2, 0
+        for i, payload in enumerate(payloads):
+            encoded = json.dumps(payload)
+            size = len(encoded) + 1
+            if chunk and (len(chunk) >= self.batch_size or chunk_bytes + size > self.batch_max_bytes):
+                yield start, chunk
+                chunk, chunk_bytes, start = [], 2, i
+            chunk.append(encoded)
+            chunk_bytes += size
+        if chunk:
+            yield start, chunk
+
+    # ------------------ SINGLE RECORD ------------------
+    # Upload results are True (delivered), False (failed, retry later) or
+    # None (rejected by the API, do not retry)
+    def record_result(self, status):
+        if 200 <= status < 300 or status == 409:
+            return True
+        return None if status in RECORD_REJECT_STATUSES else False
+
+    def send_one(self, payload):
+        started = time_module.perf_counter()
+        try:
+            r = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            UPLOAD_SECONDS.observe(time_module.perf_counter() - started, mode="single")
+            self.last_status = f"{datetime.now()} → Status {r.status_code}"
+            logger.debug(f"Sent log {payload} → Status {r.status_code}")
+            result = self.record_result(r.status_code)
+            if not result:
+                UPLOAD_ERRORS.inc(status=r.status_code)
+            return result
+        except Exception as e:
+            UPLOAD_ERRORS.inc(status=type(e).__name__)
+            self.last_status = f"Error: {e}"
+            logger.error(f"Error sending log: {e}")
+            return False
+
+    # ------------------ BATCH ------------------
+    def _record_ok(self, item):
+        if isinstance(item, bool):
+            return item
+        if not isinstance(item, dict):
+            return True
+        for key in ("ok", "success"):
+            if key in item:
+                return bool(item[key])
+        status = item.get("status")
+        if isinstance(status, int):
+            return self.record_result(status)
+        if isinstance(status, str):
+            if status.lower() in BATCH_REJECTED_STATUSES:
+                return None
+            return status.lower() in BATCH_OK_STATUSES
+        return "error" not in item
+
+    def _parse_batch_results(self, response, count):
+        # Returns one bool per record, or None when the body has no per-record results
+        try:
+            body = response.json()
+        except ValueError:
+            return None
+        return self.batch_results(body, count)
+
+    def batch_results(self, body, count):
+        # Per-record results from a decoded batch response body
+        if isinstance(body, dict):
+            body = body.get("results", body.get("records"))
+        if not isinstance(body, list) or len(body) != count:
+            return None
+        return [self._record_ok(item) for item in body]
+
+    def batch_unsupported(self, status, results):
+        # Whether a batch reply means the endpoint does not take arrays
+        if results is not None:
+            self._batch_confirmed = True
+            return False
+        if status in BATCH_REJECT_STATUSES:
+            return True
+        if not self._probe_batches:
+            return False
+        # A single-record handler may answer an array it did not understand
+        # with a success or a server error; neither may ack the whole chunk
+        return 200 <= status < 300 or (status >= 500 and not self._batch_confirmed)
+
+    def send_batch(self, chunk):
+        # Returns one bool per record, or None if the server rejected the batch format
+        body = "[" + ",".join(chunk) + "]"
+        started = time_module.perf_counter()
+        try:
+            r = self.session.post(self.batch_url, data=body.encode("utf-8"), timeout=self.timeout)
+        except Exception as e:
+            UPLOAD_ERRORS.inc(status=type(e).__name__)
+            self.last_status = f"Error: {e}"
+            logger.error(f"Error sending batch of {len(chunk)} logs: {e}")
+            return [False] * len(chunk)
+
+        UPLOAD_SECONDS.observe(time_module.perf_counter() - started, mode="batch")
+        self.last_status = f"{datetime.now()} → Status {r.status_code}"
+        if not r.ok:
+            UPLOAD_ERRORS.inc(status=r.status_code)
+        if r.status_code == 413 and len(chunk) > 1:
+            # Too large for the server: halve and try again
+            mid = len(chunk) // 2
+            first = self.send_batch(chunk[:mid])
+            second = self.send_batch(chunk[mid:])
+            if first is None or second is None:
+                return None
+            return first + second
+
+        results = self._parse_batch_results(r, len(chunk))
+        if self.batch_unsupported(r.status_code, results):
+            logger.warning(f"Batch upload not accepted → Status {r.status_code}, falling back to per-record upload")
+            return None
+        if results is None:
+            results = [r.ok] * len(chunk)
+        logger.info(f"Sent batch of {len(chunk)} logs → Status {r.status_code}, "
+              f"{results.count(True)} accepted")
+        return results
+
+    # ------------------ RECONCILE ------------------
+    def fetch_known(self, start, end, known_url=None):
+        # (user_id, timestamp) of every record the API holds in [start, end],
+        # following "next" cursors. Returns None if the endpoint has no listing.
+        url = known_url or self.api_url
+        params = {"from": self.build_payload("", start)["timestamp"],
+                  "to": self.build_payload("", end)["timestamp"]}
+        known = []
+        while True:
+            r = self.session.get(url, params=params, timeout=self.timeout)
+            self.last_status = f"{datetime.now()} → Status {r.status_code}"
+            if r.status_code in BATCH_REJECT_STATUSES:
+                logger.warning(f"API does not list known records → Status {r.status_code}")
+                return None
+            r.raise_for_status()
+            body = r.json()
+            items = body.get("records", body.get("results", [])) if isinstance(body, dict) else body
+            known.extend((str(item["user_id"]), item["timestamp"]) for item in items)
+            cursor = body.get("next") if isinstance(body, dict) else None
+            if not cursor:
+                return known
+            params["cursor"] = cursor
+
+    # ------------------ DISPATCH ------------------
+    def send(self, logs):
+        # Upload logs over the worker pool; returns one result per log, in input order
+        if not logs:
+            return []
+        payloads = [self.build_payload(log.user_id, log.timestamp) for log in logs]
+        executor = self._get_executor()
+        results = [False] * len(payloads)
+        resend = []
+
+        if self.batch_mode:
+            futures = [(start, len(chunk), executor.submit(self.send_batch, chunk))
+                       for start, chunk in self._chunk_payloads(payloads)]
+            for start, count, future in futures:
+                chunk_results = future.result()
+                if chunk_results is None:
+                    # Server does not accept arrays: stay on per-record uploads from here on
+                    self.batch_mode = False
+                    resend.extend(range(start, start + count))
+                else:
+                    results[start:start + count] = chunk_results
+        else:
+            resend = range(len(payloads))
+
+        futures = [(i, executor.submit(self.send_one, payloads[i])) for i in resend]
+        for i, future in futures:
+            results[i] = future.result()
+        return results
+
@@ -0,0 +1,87 @@
+import logging
+import sqlite3
+import threading
+import time as time_module
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_users (
+    device_serial TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (device_serial, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS device_user_state (
+    device_serial TEXT PRIMARY KEY,
+    signature TEXT,
+    refreshed_at REAL NOT NULL
+);
+"""
+
+
+def enrollment_signature(conn):
+    # User, fingerprint, card and face counts from the last read_sizes(); any
+    # enrollment or deletion on the device changes at least one of them
+    return "/".join(str(getattr(conn, field, None)) for field in ("users", "fingers", "cards", "faces"))
+
+
+class UserDirectory:
+    # Device users (user_id → name) persisted per device serial, so names are
+    # available as soon as a device connects instead of after downloading the
+    # whole user table. Rows are keyed by user_id as a string, the form punches
+    # carry it in.
+    def __init__(self, path="attendance.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def load(self, device_serial):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT user_id, name FROM device_users WHERE device_serial = ?", (device_serial,)).fetchall()
+        return dict(rows)
+
+    def signature(self, device_serial):
+        # Enrollment signature the cached users were read under, or None if never read
+        with self._lock:
+            row = self._db.execute(
+                "SELECT signature FROM device_user_state WHERE device_serial = ?", (device_serial,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, device_serial, users, signature=None):
+        # Replace the cached users with a fresh device list, writing only the
+        # rows that changed. Returns the new user_id → name dict.
+        users = {str(user_id): name or "" for user_id, name in users.items()}
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cached = dict(self._db.execute(
+                    "SELECT user_id, name FROM device_users WHERE device_serial = ?", (device_serial,)))
+                changed = [(device_serial, user_id, name) for user_id, name in users.items()
+                           if cached.get(user_id) != name]
+                removed = [(device_serial, user_id) for user_id in cached.keys() - users.keys()]
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO device_users (device_serial, user_id, name) VALUES (?, ?, ?)", changed)
+                self._db.executemany(
+                    "DELETE FROM device_users WHERE device_serial = ? AND user_id = ?", removed)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO device_user_state (device_serial, signature, refreshed_at) "
+                    "VALUES (?, ?, ?)", (device_serial, signature, time_module.time()))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if changed or removed:
+            added = len(users.keys() - cached.keys())
+            logger.info(f"User directory for {device_serial}: {added} added, "
+                        f"{len(changed) - added} renamed, {len(removed)} removed")
+        return users